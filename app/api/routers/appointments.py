@@ -1,27 +1,342 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Header
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from app.dependencies import get_current_user
-from app.db import get_db, get_connection, execute_with_retry
-from app.models.schemas import AppointmentCreate, AppointmentUpdate, AppointmentStatusUpdate, AppointmentResponse, AppointmentServiceNestedResponse, AvailableSlotsResponse
-from app.services.appointment_service import check_double_booking
-from typing import List, Optional, Union
+from app.db import get_db, get_connection, get_readonly_connection, execute_with_retry
+from app.sql_utils import JSON_IDS_SQL, json_ids
+from app.models.schemas import AppointmentCreate, AppointmentUpdate, AppointmentStatusUpdate, AppointmentBulkAction, AppointmentResponse, AppointmentServiceNestedResponse, AvailableSlotsResponse
+from app.services.appointment_service import check_double_booking, staff_day_booking_lock
+from typing import AsyncIterator, List, Optional, Tuple, Union
+from contextlib import AsyncExitStack
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from pydantic import TypeAdapter
 import aiomysql
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
-# Güvenli pymysql import - IntegrityError tuple pattern
-try:
-    import pymysql.err
-    IntegrityErrors = (pymysql.err.IntegrityError,)
-except Exception:
-    IntegrityErrors = ()
+# pymysql aiomysql'in zorunlu bağımlılığı; IntegrityError her zaman import edilebilir
+from pymysql.err import IntegrityError
 
 router = APIRouter()
 
-@router.post("/", response_model=AppointmentResponse, summary="Create appointment", description="Create a new appointment with double-booking prevention")
+# list_appointments stream'inde server-side cursor'dan tek seferde okunan satır sayısı
+_STREAM_BATCH_SIZE = 200
+
+# list_appointments sonucu sınırlıysa (limit verilmiş ya da start_date..end_date en fazla bu kadar gün)
+# fetchall + normal response; açık uçlu / daha uzun aralıklar stream edilir.
+# Takvimin ay görünümü (~6 hafta) buffered yolda kalır
+_LIST_BUFFERED_MAX_DAYS = 62
+_LIST_MAX_LIMIT = 1000
+
+
+# Tek bir appointment service'inin JSON objesi (aps = appointment_services, svc = services)
+# price CHAR olarak alınır ki Decimal hassasiyeti (örn. "100.00") korunur
+_SERVICE_JSON_OBJECT_SQL = """JSON_OBJECT(
+        'service_id', aps.service_id,
+        'name', svc.name,
+        'duration_minutes', svc.duration_minutes,
+        'price', CAST(aps.price AS CHAR),
+        'created_at', DATE_FORMAT(aps.created_at, '%%Y-%%m-%%dT%%H:%%i:%%s')
+    )"""
+
+# Appointment response'unda services listesi (JSON_ARRAYAGG, correlated subquery)
+_SERVICES_JSON_SQL = f"""(
+    SELECT JSON_ARRAYAGG({_SERVICE_JSON_OBJECT_SQL})
+    FROM appointment_services aps
+    LEFT JOIN services svc ON svc.id = aps.service_id AND svc.business_id = a.business_id
+    WHERE aps.appointment_id = a.id
+)"""
+
+# Appointment'a bağlı transaction LEFT JOIN ile ayrı kolonlar olarak (txn_*), bkz. _pop_transaction
+# amount DOUBLE olarak alınır: driver doğrudan float üretir (Decimal + float() dönüşümü yok).
+# CAST(... AS DOUBLE) 8.0.17+ gerektirir; float literal ile toplama tüm 8.0 sürümlerinde DOUBLE döner
+# Tarihler ISO string olarak gelir (datetime parse + isoformat() yok; TIMESTAMP kesirsiz, çıktı aynı)
+_TXN_COLUMNS_SQL = """t.id AS txn_id,
+        t.amount + 0e0 AS txn_amount,
+        t.payment_method AS txn_payment_method,
+        t.status AS txn_status,
+        DATE_FORMAT(t.transaction_date, '%%Y-%%m-%%dT%%H:%%i:%%s') AS txn_transaction_date,
+        DATE_FORMAT(t.created_at, '%%Y-%%m-%%dT%%H:%%i:%%s') AS txn_created_at"""
+
+_TXN_JOIN_SQL = "LEFT JOIN transactions t ON t.appointment_id = a.id AND t.business_id = a.business_id"
+
+# Tek appointment okuma/yazma sorguları: staff kısıtı her zaman aynı SQL şekliyle
+# (%s IS NULL OR staff_id = %s) - staff olmayan kullanıcılar için NULL bağlanır.
+# Böylece rol başına ayrı metin yerine endpoint başına tek sabit SQL metni gönderilir.
+def _build_appointment_detail_sql(services_column: str, where_clause: str) -> str:
+    return f"""
+    SELECT 
+        a.id, a.business_id, a.customer_id, a.staff_id, 
+        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
+        a.created_at, a.updated_at,
+        c.full_name AS customer_full_name,
+        s.full_name AS staff_full_name,
+        {services_column}
+        {_TXN_COLUMNS_SQL}
+    FROM appointments a
+    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
+    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
+    {_TXN_JOIN_SQL}
+    WHERE {where_clause}
+"""
+
+
+_SINGLE_APPOINTMENT_WHERE_SQL = "a.id = %s AND a.business_id = %s AND (%s IS NULL OR a.staff_id = %s) LIMIT 1"
+
+# include_services -> SQL; parametreler: (business_id, business_id, appointment_id, business_id, staff_id, staff_id)
+_APPOINTMENT_DETAIL_SQL = {
+    True: _build_appointment_detail_sql(f"{_SERVICES_JSON_SQL} AS services_json,", _SINGLE_APPOINTMENT_WHERE_SQL),
+    False: _build_appointment_detail_sql("", _SINGLE_APPOINTMENT_WHERE_SQL),
+}
+
+# Bulk approve/reject read-back; parametreler: (business_id, business_id, business_id, json ids)
+_APPOINTMENTS_DETAIL_BY_IDS_SQL = _build_appointment_detail_sql(
+    f"{_SERVICES_JSON_SQL} AS services_json,",
+    f"a.business_id = %s AND a.id IN ({JSON_IDS_SQL}) ORDER BY a.id"
+)
+
+_UPDATE_APPOINTMENT_STATUS_SQL = (
+    "UPDATE appointments SET status = %s, updated_at = CURRENT_TIMESTAMP "
+    "WHERE id = %s AND business_id = %s AND (%s IS NULL OR staff_id = %s)"
+)
+
+_APPOINTMENT_EXISTS_SQL = (
+    "SELECT id FROM appointments "
+    "WHERE id = %s AND business_id = %s AND (%s IS NULL OR staff_id = %s) LIMIT 1"
+)
+
+# approve/reject: sadece 'pending' appointment'lar güncellenir (pending kontrolü WHERE içinde)
+# admin_note NULL bağlanırsa mevcut not korunur
+_UPDATE_PENDING_APPOINTMENTS_SQL = f"""
+    UPDATE appointments
+    SET status = %s, admin_note = COALESCE(%s, admin_note), updated_at = CURRENT_TIMESTAMP
+    WHERE business_id = %s AND status = 'pending' AND id IN ({JSON_IDS_SQL})
+"""
+
+_APPOINTMENT_STATUSES_BY_IDS_SQL = (
+    f"SELECT id, status FROM appointments WHERE business_id = %s AND id IN ({JSON_IDS_SQL})"
+)
+
+# create_appointment / update_appointment sabit SQL metinleri
+# aiomysql server-side prepared statement desteklemez; metinler modül seviyesinde bir kez
+# oluşturulur ve her istekte birebir aynı string gönderilir (request başına string inşası yok)
+
+# Customer, staff ve service'ler tek sorguda (UNION ALL + kind etiketi)
+# name/duration_minutes response'u bellekte kurmak için de kullanılır
+_CREATE_VALIDATION_SQL = f"""
+    SELECT 'customer' AS kind, id, NULL AS price, full_name AS name, NULL AS duration_minutes
+    FROM customers WHERE id = %s AND business_id = %s
+    UNION ALL
+    SELECT 'staff' AS kind, id, NULL AS price, full_name AS name, NULL AS duration_minutes
+    FROM staff WHERE id = %s AND business_id = %s AND is_active = TRUE
+    UNION ALL
+    SELECT 'service' AS kind, id, price, name, duration_minutes
+    FROM services WHERE id IN ({JSON_IDS_SQL}) AND business_id = %s AND is_active = TRUE
+"""
+
+# update_appointment: customer ve staff tek sorguda (UNION ALL + kind etiketi), full_name response için
+_UPDATE_VALIDATION_SQL = """
+    SELECT 'customer' AS kind, full_name AS name
+    FROM customers WHERE id = %s AND business_id = %s
+    UNION ALL
+    SELECT 'staff' AS kind, full_name AS name
+    FROM staff WHERE id = %s AND business_id = %s AND is_active = TRUE
+"""
+
+# update_appointment: yeni service_ids doğrulaması (id sayısından bağımsız tek SQL metni)
+_UPDATE_SERVICES_VALIDATION_SQL = (
+    f"SELECT id, price, name, duration_minutes FROM services "
+    f"WHERE id IN ({JSON_IDS_SQL}) AND business_id = %s AND is_active = TRUE"
+)
+
+# Yazılan (create/update) appointment'ın DB tarafından atanan değerleri (PK + appointment_id index, commit öncesi)
+_WRITTEN_APPOINTMENT_VALUES_SQL = """
+    SELECT a.appointment_date, a.created_at, a.updated_at,
+           aps.service_id, aps.created_at AS service_created_at
+    FROM appointments a
+    LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
+    WHERE a.id = %s
+"""
+
+_IDEMPOTENT_APPOINTMENT_SQL = (
+    "SELECT id, customer_id, staff_id, appointment_date FROM appointments "
+    "WHERE business_id = %s AND idempotency_key = %s LIMIT 1"
+)
+
+_INSERT_APPOINTMENT_SQL = (
+    "INSERT INTO appointments (business_id, customer_id, staff_id, appointment_date, status, notes, "
+    "admin_note, staff_note, customer_note, idempotency_key) "
+    "VALUES (%s, %s, %s, %s, 'scheduled', %s, %s, %s, %s, %s)"
+)
+
+_INSERT_APPOINTMENT_SERVICE_SQL = (
+    "INSERT INTO appointment_services (appointment_id, service_id, price) VALUES (%s, %s, %s)"
+)
+
+
+# Activities: bugünün randevuları (staff / admin-owner varyantları)
+# SARGable yarı-açık aralık (DATE(...) = CURDATE() yerine): idx_business_staff_date /
+# idx_business_date üzerinde range scan
+# Services appointment başına JSON array olarak aynı satırda (tek round-trip, ayrı services sorgusu yok)
+_TODAY_APPOINTMENTS_SELECT_SQL = f"""
+    SELECT 
+        a.id, a.business_id, a.customer_id, a.staff_id, 
+        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
+        a.created_at, a.updated_at,
+        c.full_name AS customer_full_name,
+        s.full_name AS staff_full_name,
+        {_SERVICES_JSON_SQL} AS services_json
+    FROM appointments a
+    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
+    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
+    WHERE a.business_id = %s"""
+
+_TODAY_STAFF_APPOINTMENTS_SQL = _TODAY_APPOINTMENTS_SELECT_SQL + """
+      AND a.staff_id = %s
+      AND a.appointment_date >= CURDATE()
+      AND a.appointment_date < CURDATE() + INTERVAL 1 DAY
+    ORDER BY a.appointment_date ASC
+    LIMIT %s
+"""
+
+_TODAY_APPOINTMENTS_SQL = _TODAY_APPOINTMENTS_SELECT_SQL + """
+      AND a.appointment_date >= CURDATE()
+      AND a.appointment_date < CURDATE() + INTERVAL 1 DAY
+    ORDER BY a.appointment_date ASC
+    LIMIT %s
+"""
+
+
+# Dashboard aynı tarih filtreleriyle poll ettiği için parse sonucu cache'lenir
+_parse_iso_date = lru_cache(maxsize=1024)(date.fromisoformat)
+
+
+def _parse_date_param(value: str, name: str) -> date:
+    """YYYY-MM-DD query parametresini date'e çevirir, geçersizse 400 döner."""
+    try:
+        return _parse_iso_date(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {name} format. Expected YYYY-MM-DD"
+        )
+
+
+# update_appointment'ta strip + boş string -> None normalize edilen not alanları
+_NOTE_FIELDS = ('admin_note', 'staff_note', 'customer_note')
+
+
+def _clean_note(value: str) -> Optional[str]:
+    """Notu strip eder; boş kalırsa None döner."""
+    return value.strip() or None
+
+
+# Stream edilen list batch'leri response_model ile aynı şemadan geçer (validate + JSON dump):
+# OpenAPI şeması ve gerçek çıktı ayrışamaz (yeni kolon / yeni status değeri fark edilir)
+_APPOINTMENT_LIST_ADAPTER = TypeAdapter(List[AppointmentResponse])
+
+
+def _load_services_json(services_json: Optional[str]) -> List[dict]:
+    """JSON_ARRAYAGG services sonucunu listeye çevirir (NULL ise boş liste)."""
+    services = orjson.loads(services_json) if services_json else []
+    # JSON_ARRAYAGG sıra garantisi vermez, ORDER BY aps.created_at davranışını koru
+    services.sort(key=lambda service: service['created_at'])
+    return services
+
+
+def _pop_transaction(appointment: dict) -> Optional[dict]:
+    """txn_* kolonlarını satırdan çıkarıp transaction dict'i döndürür (t.id NULL ise None)."""
+    txn_id = appointment.pop('txn_id')
+    txn_amount = appointment.pop('txn_amount')
+    txn_payment_method = appointment.pop('txn_payment_method')
+    txn_status = appointment.pop('txn_status')
+    txn_transaction_date = appointment.pop('txn_transaction_date')
+    txn_created_at = appointment.pop('txn_created_at')
+    if txn_id is None:
+        return None
+    return {
+        'id': txn_id,
+        'amount': txn_amount,
+        'payment_method': txn_payment_method,
+        'status': txn_status,
+        'transaction_date': txn_transaction_date,
+        'created_at': txn_created_at
+    }
+
+
+async def _load_appointment_full(
+    cursor,
+    business_id: int,
+    appointment_id: int,
+    staff_id: Optional[int] = None,
+    include_services: bool = True
+) -> Optional[dict]:
+    """
+    Appointment + names + services + transaction tek sorguda (tek round-trip). Yoksa None.
+    staff_id verilirse sadece o staff'ın appointment'ı döner; include_services=False ise services None.
+    """
+    await cursor.execute(
+        _APPOINTMENT_DETAIL_SQL[include_services],
+        (business_id, business_id, appointment_id, business_id, staff_id, staff_id)
+    )
+    appointment = await cursor.fetchone()
+    if not appointment:
+        return None
+    
+    if include_services:
+        appointment['services'] = _load_services_json(appointment.pop('services_json'))
+    else:
+        appointment['services'] = None
+    
+    # Transaction bilgisi (txn_* kolonları; t.id NULL ise transaction yok)
+    appointment['transaction'] = _pop_transaction(appointment)
+    return appointment
+
+
+def _round_to_seconds(value: datetime) -> datetime:
+    """MySQL DATETIME(0) yazımıyla aynı: mikrosaniye >= 500000 ise yukarı, değilse aşağı yuvarlar."""
+    if value.microsecond >= 500000:
+        value += timedelta(seconds=1)
+    return value.replace(microsecond=0)
+
+
+async def _find_idempotent_appointment(
+    cursor,
+    business_id: int,
+    idempotency_key: str,
+    appointment_data: AppointmentCreate
+) -> Optional[dict]:
+    """
+    Aynı Idempotency-Key ile daha önce oluşturulmuş appointment'ı döndürür (yoksa None).
+    Key farklı bir istek için kullanılmışsa 422 döner.
+    """
+    await cursor.execute(_IDEMPOTENT_APPOINTMENT_SQL, (business_id, idempotency_key))
+    existing = await cursor.fetchone()
+    if not existing:
+        return None
+    
+    # appointment_date DB'ye tzinfo'suz yazılıyor ve DATETIME (fsp yok) kesirli saniyeyi en yakın
+    # saniyeye yuvarlıyor; karşılaştırma da saklanan değerle aynı şekilde normalize edilir
+    requested_date = _round_to_seconds(appointment_data.appointment_date.replace(tzinfo=None))
+    if (
+        existing['customer_id'] != appointment_data.customer_id
+        or existing['staff_id'] != appointment_data.staff_id
+        or existing['appointment_date'] != requested_date
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different appointment"
+        )
+    
+    return await _load_appointment_full(cursor, business_id, existing['id'])
+
+@router.post("/", response_model=AppointmentResponse, response_class=ORJSONResponse, summary="Create appointment", description="Create a new appointment with double-booking prevention")
 async def create_appointment(
     appointment_data: AppointmentCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=64, description="Retry-safe create: same key returns the already created appointment")
 ):
     # business_id kontrolü
     business_id = current_user.get("business_id")
@@ -32,34 +347,27 @@ async def create_appointment(
         )
     
     # Use get_connection() context manager for connection with ping check
+    # Aynı staff-gün için eşzamanlı create'ler önce process içinde sıraya girer
+    # (bekleyen istek pool connection'ı tutmaz); DB kontrolü nihai otoritedir.
     try:
-        async with get_connection() as conn:
-            appointment_id = None
+        # Idempotency-Key tekrarı (timeout sonrası retry, çift tıklama): mevcut appointment'ı
+        # döndür. Lock'tan önce bakılır: replay staff-gün kuyruğunda beklemez,
+        # double-booking/insert yolunun tamamı atlanır
+        if idempotency_key:
+            async with get_connection() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    existing_appointment = await _find_idempotent_appointment(
+                        cursor, business_id, idempotency_key, appointment_data
+                    )
+            if existing_appointment is not None:
+                return existing_appointment
+        
+        async with staff_day_booking_lock(business_id, appointment_data.staff_id, appointment_data.appointment_date), \
+                get_connection() as conn:
             try:
                 await conn.begin()
                 
                 async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    # Customer ve Staff'ın aynı business'a ait olduğunu kontrol et
-                    await cursor.execute(
-                        "SELECT id FROM customers WHERE id = %s AND business_id = %s LIMIT 1",
-                        (appointment_data.customer_id, business_id)
-                    )
-                    if not await cursor.fetchone():
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Customer not found"
-                        )
-                    
-                    await cursor.execute(
-                        "SELECT id FROM staff WHERE id = %s AND business_id = %s AND is_active = TRUE LIMIT 1",
-                        (appointment_data.staff_id, business_id)
-                    )
-                    if not await cursor.fetchone():
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Staff not found or inactive"
-                        )
-                    
                     # Service IDs'yi normalize et (duplicate'leri kaldır)
                     unique_service_ids = list(dict.fromkeys(appointment_data.service_ids))
                     
@@ -70,14 +378,33 @@ async def create_appointment(
                             detail="service_ids is required"
                         )
                     
-                    # Service'lerin aynı business'a ait olduğunu ve aktif olduğunu kontrol et
-                    placeholders = ','.join(['%s'] * len(unique_service_ids))
+                    # Customer, staff ve service'lerin aynı business'a ait olduğunu tek sorguda kontrol et
+                    # (UNION ALL + kind etiketi: üç ayrı round-trip yerine tek round-trip)
                     await cursor.execute(
-                        f"SELECT id, price FROM services WHERE id IN ({placeholders}) AND business_id = %s AND is_active = TRUE",
-                        (*unique_service_ids, business_id)
+                        _CREATE_VALIDATION_SQL,
+                        (
+                            appointment_data.customer_id, business_id,
+                            appointment_data.staff_id, business_id,
+                            json_ids(unique_service_ids), business_id
+                        )
                     )
-                    services = await cursor.fetchall()
+                    validation_rows = await cursor.fetchall()
+                    
+                    # Hata sırası korunuyor: önce customer, sonra staff, en son services
+                    names = {row['kind']: row['name'] for row in validation_rows if row['kind'] != 'service'}
+                    if 'customer' not in names:
+                        raise HTTPException(
+                            status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Customer not found"
+                        )
                     
+                    if 'staff' not in names:
+                        raise HTTPException(
+                            status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Staff not found or inactive"
+                        )
+                    
+                    services = [row for row in validation_rows if row['kind'] == 'service']
                     if len(services) != len(unique_service_ids):
                         raise HTTPException(
                             status_code=status.HTTP_404_NOT_FOUND,
@@ -114,38 +441,80 @@ async def create_appointment(
                     # Not: unique_business_staff_datetime UNIQUE KEY yalnızca aynı start time'ı engeller,
                     # overlap kontrolü için yeterli değildir (yukarıdaki check_double_booking gerekli).
                     await cursor.execute(
-                        "INSERT INTO appointments (business_id, customer_id, staff_id, appointment_date, status, notes, admin_note, staff_note, customer_note) VALUES (%s, %s, %s, %s, 'scheduled', %s, %s, %s, %s)",
-                        (business_id, appointment_data.customer_id, appointment_data.staff_id, appointment_data.appointment_date, appointment_data.notes, appointment_data.admin_note, appointment_data.staff_note, appointment_data.customer_note)
+                        _INSERT_APPOINTMENT_SQL,
+                        (business_id, appointment_data.customer_id, appointment_data.staff_id, appointment_data.appointment_date, appointment_data.notes, appointment_data.admin_note, appointment_data.staff_note, appointment_data.customer_note, idempotency_key)
                     )
                     appointment_id = cursor.lastrowid
                     
                     # Appointment services ekle (her service için price ile)
-                    service_price_map = {s['id']: s['price'] for s in services}
-                    for service_id in unique_service_ids:
-                        service_price = service_price_map[service_id]
-                        await cursor.execute(
-                            "INSERT INTO appointment_services (appointment_id, service_id, price) VALUES (%s, %s, %s)",
-                            (appointment_id, service_id, service_price)
-                        )
+                    # executemany tek bir multi-row INSERT'e çevrilir (service başına round-trip yok)
+                    service_map = {s['id']: s for s in services}
+                    await cursor.executemany(
+                        _INSERT_APPOINTMENT_SERVICE_SQL,
+                        [
+                            (appointment_id, service_id, service_map[service_id]['price'])
+                            for service_id in unique_service_ids
+                        ]
+                    )
+                    
+                    # Response bellekte kurulur; commit sonrası re-read yok.
+                    # Sadece DB'nin atadığı değerler (timestamp'ler, saniyeye yuvarlanmış appointment_date)
+                    # aynı transaction içinde tek PK sorgusuyla okunur.
+                    await cursor.execute(_WRITTEN_APPOINTMENT_VALUES_SQL, (appointment_id,))
+                    created_rows = await cursor.fetchall()
+                    service_created_at = {row['service_id']: row['service_created_at'] for row in created_rows}
+                    
+                    appointment = {
+                        'id': appointment_id,
+                        'business_id': business_id,
+                        'customer_id': appointment_data.customer_id,
+                        'staff_id': appointment_data.staff_id,
+                        'appointment_date': created_rows[0]['appointment_date'],
+                        'status': 'scheduled',
+                        'notes': appointment_data.notes,
+                        'admin_note': appointment_data.admin_note,
+                        'staff_note': appointment_data.staff_note,
+                        'customer_note': appointment_data.customer_note,
+                        'created_at': created_rows[0]['created_at'],
+                        'updated_at': created_rows[0]['updated_at'],
+                        'customer_full_name': names['customer'],
+                        'staff_full_name': names['staff'],
+                        'services': [
+                            {
+                                'service_id': service_id,
+                                'name': service_map[service_id]['name'],
+                                'duration_minutes': service_map[service_id]['duration_minutes'],
+                                'price': service_map[service_id]['price'],
+                                'created_at': service_created_at[service_id]
+                            }
+                            for service_id in unique_service_ids
+                        ],
+                        # Yeni oluşturulan appointment'a henüz transaction bağlanmış olamaz
+                        'transaction': None
+                    }
                 
                 await conn.commit()
+                return appointment
                 
             except HTTPException:
                 # Commit öncesi HTTPException (rollback gerekli)
                 await conn.rollback()
                 raise
-            except IntegrityErrors as e:
+            except IntegrityError as e:
                 # IntegrityError ayrı except bloğu (double-booking veya FK hatası)
                 await conn.rollback()
                 
-                # MySQL duplicate key error code 1062 kontrolü
-                error_code = e.args[0] if e.args else None
-                try:
-                    error_code = int(error_code)
-                except (TypeError, ValueError):
-                    error_code = None
-                
-                if error_code == 1062:
+                # MySQL duplicate key error code 1062 kontrolü (pymysql errno her zaman int)
+                if e.args and e.args[0] == 1062:
+                    # Aynı Idempotency-Key ile eşzamanlı istek (başka worker) önce commit ettiyse onu döndür
+                    if idempotency_key:
+                        async with conn.cursor(aiomysql.DictCursor) as cursor:
+                            existing_appointment = await _find_idempotent_appointment(
+                                cursor, business_id, idempotency_key, appointment_data
+                            )
+                        if existing_appointment is not None:
+                            return existing_appointment
+                    
                     # Double-booking => 409 Conflict
                     raise HTTPException(
                         status_code=status.HTTP_409_CONFLICT,
@@ -157,156 +526,15 @@ async def create_appointment(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail="Invalid appointment data"
                     )
-            except Exception as e:
-                # MySQL duplicate fallback kontrolü (pymysql import edilemezse)
+            except Exception:
+                # Duplicate tespiti yalnızca IntegrityError errno üzerinden; diğer hatalar => 500
                 await conn.rollback()
-                
-                error_msg = str(e).lower()
-                error_code = e.args[0] if e.args else None
-                
-                # error_code'u int'e dönüştür
-                try:
-                    error_code = int(error_code)
-                except (TypeError, ValueError):
-                    pass
-                
-                # MySQL duplicate key error code 1062 veya "Duplicate entry" mesajı
-                is_duplicate = (
-                    error_code == 1062 or
-                    'duplicate entry' in error_msg or
-                    'duplicate key' in error_msg
-                )
-                
-                if is_duplicate:
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail="Staff is already booked at this time"
-                    )
-                
-                # Diğer hatalar => 500 Internal Server Error
+                logger.exception("create_appointment failed business_id=%s", business_id)
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Failed to create appointment"
                 )
             
-            # B) Response read: yeni cursor ile appointment + names + services select et
-            # Note: appointment_id None kontrolü
-            if appointment_id is None:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to create appointment: appointment_id is None"
-                )
-            
-            # Aşama B: Commit sonrası read-only işlemler
-            # ÖNEMLİ: Bu aşamada begin/rollback YOK - zaten commit edildi
-            # Aynı conn kullanılıyor (stable, commit sonrası da geçerli)
-            try:
-                # Commit sonrası SELECT (tenant-safe, rollback yok - yeni cursor ile)
-                # Note: conn.begin() çağrılmıyor, rollback çağrılmıyor
-                async with conn.cursor(aiomysql.DictCursor) as cursor2:
-                    # Appointment bilgilerini customer ve staff full_name'leri ile birlikte çek
-                    await cursor2.execute(
-                        """
-                        SELECT 
-                            a.id, a.business_id, a.customer_id, a.staff_id, 
-                            a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                            a.created_at, a.updated_at,
-                            c.full_name AS customer_full_name,
-                            s.full_name AS staff_full_name
-                        FROM appointments a
-                        LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                        LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                        WHERE a.id = %s AND a.business_id = %s
-                        LIMIT 1
-                        """,
-                        (business_id, business_id, appointment_id, business_id)
-                    )
-                    appointment = await cursor2.fetchone()
-                    
-                    if not appointment:
-                        raise HTTPException(
-                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail="Failed to retrieve created appointment"
-                        )
-                    
-                    # Services bilgilerini çek (LEFT JOIN kullanarak services olmasa bile appointment dönsün)
-                    await cursor2.execute(
-                        """
-                        SELECT 
-                            aps.service_id,
-                            s.name,
-                            s.duration_minutes,
-                            aps.price,
-                            aps.created_at
-                        FROM appointments a
-                        LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                        LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                        WHERE a.business_id = %s AND a.id = %s
-                        ORDER BY aps.created_at
-                        """,
-                        (business_id, appointment_id)
-                    )
-                    services_data = await cursor2.fetchall()
-                    
-                    # Services alanını ekle (NULL service_id'leri filtrele)
-                    # Deterministik: Her zaman list döndür (hiç yoksa boş liste)
-                    appointment['services'] = [
-                        {
-                            'service_id': s['service_id'],
-                            'name': s['name'],
-                            'duration_minutes': s['duration_minutes'],
-                            'price': s['price'],
-                            'created_at': s['created_at']
-                        }
-                        for s in services_data if s['service_id'] is not None
-                    ]
-                    # Eğer services hiç yoksa boş liste garantisi
-                    if not appointment.get('services'):
-                        appointment['services'] = []
-                    
-                    # Transaction bilgisini çek (eğer varsa) - LEFT JOIN ile tek query'de
-                    try:
-                        await cursor2.execute(
-                            """
-                            SELECT 
-                                t.id, t.business_id, t.appointment_id, t.customer_id, 
-                                t.amount, t.payment_method, t.status, t.transaction_date, t.created_at
-                            FROM appointments a
-                            LEFT JOIN transactions t ON t.appointment_id = a.id AND t.business_id = a.business_id
-                            WHERE a.id = %s AND a.business_id = %s
-                            LIMIT 1
-                            """,
-                            (appointment_id, business_id)
-                        )
-                        result = await cursor2.fetchone()
-                        
-                        if result and result.get('id') is not None:  # Transaction exists (t.id is not NULL)
-                            appointment['transaction'] = {
-                                'id': result['id'],
-                                'amount': float(result['amount']),
-                                'payment_method': result['payment_method'],
-                                'status': result['status'],
-                                'transaction_date': result['transaction_date'].isoformat() if result['transaction_date'] else None,
-                                'created_at': result['created_at'].isoformat() if result['created_at'] else None
-                            }
-                        else:
-                            appointment['transaction'] = None
-                    except Exception as e:
-                        # If transaction query fails, set transaction to None (don't break the appointment response)
-                        logger.warning(f"Failed to fetch transaction for appointment {appointment_id}: {str(e)}")
-                        appointment['transaction'] = None
-                    
-                    return appointment
-            except HTTPException:
-                # Re-raise HTTPException as-is
-                raise
-            except Exception as e:
-                # B aşamasında hata -> rollback yok (zaten commit edildi) -> 500
-                logger.error(f"Failed to retrieve created appointment {appointment_id}: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to retrieve created appointment"
-                )
     except RuntimeError as e:
         # get_connection() RuntimeError fırlatırsa (pool not initialized)
         raise HTTPException(
@@ -314,7 +542,168 @@ async def create_appointment(
             detail="Database pool is not initialized"
         )
 
-@router.get("/", response_model=List[AppointmentResponse], summary="List appointments", description="Get all appointments for the authenticated business, optionally including services")
+@lru_cache(maxsize=2048)
+def _compile_list_query(
+    include_names: bool,
+    include_services: bool,
+    exclude_pending_rejected: bool,
+    has_start_date: bool,
+    has_end_date: bool,
+    has_staff: bool,
+    has_customer: bool,
+    status_count: int,
+    has_service: bool,
+    has_limit: bool = False
+) -> Tuple[str, int]:
+    """
+    list_appointments SELECT'ini filtre imzasına göre derler: (query, filtre sayısı).
+    Parametreler çağıran tarafta aynı sırayla bağlanır: [business_id, business_id] (include_names),
+    business_id, start_date, end_date, staff_ids, customer_ids, statuses..., service_ids, limit.
+    """
+    # Build WHERE conditions dynamically
+    where_conditions = ["a.business_id = %s"]
+    
+    if exclude_pending_rejected:
+        # Exclude pending and rejected (for appointments list page)
+        where_conditions.append("a.status NOT IN ('pending', 'rejected')")
+    
+    # Date range filters (SARGable half-open range: appointment_date index'i kullanılabilir)
+    # DATE(a.appointment_date) >= X  <=>  a.appointment_date >= X 00:00:00
+    # DATE(a.appointment_date) <  Y  <=>  a.appointment_date <  Y 00:00:00 (end_date exclusive)
+    if has_start_date:
+        where_conditions.append("a.appointment_date >= %s")
+    if has_end_date:
+        where_conditions.append("a.appointment_date < %s")
+    
+    # Staff filter (can be multiple)
+    if has_staff:
+        where_conditions.append(f"a.staff_id IN ({JSON_IDS_SQL})")
+    
+    # Customer filter (can be multiple)
+    if has_customer:
+        where_conditions.append(f"a.customer_id IN ({JSON_IDS_SQL})")
+    
+    # Status filter (can be multiple)
+    # Not: status ENUM (en fazla 6 değer) olduğu için placeholder'lı IN kalıyor;
+    # JSON_TABLE VARCHAR kolonu ENUM collation'ı ile karşılaştırmada collation karışıklığı yaratır
+    if status_count:
+        placeholders = ','.join(['%s'] * status_count)
+        where_conditions.append(f"a.status IN ({placeholders})")
+    
+    # Service filter: EXISTS semijoin (JOIN + DISTINCT yerine; satır çoğalması/sort yok)
+    if has_service:
+        where_conditions.append(
+            f"EXISTS (SELECT 1 FROM appointment_services aps_filter "
+            f"WHERE aps_filter.appointment_id = a.id AND aps_filter.service_id IN ({JSON_IDS_SQL}))"
+        )
+    
+    where_clause = " AND ".join(where_conditions)
+    
+    # include_services=true ise services appointment başına JSON array olarak aynı satırda gelir
+    # (correlated JSON_ARRAYAGG; satırlar stream edilirken ikinci bir sorguya gerek kalmaz)
+    services_column = f", {_SERVICES_JSON_SQL} AS services_json" if include_services else ""
+    
+    if include_names:
+        # JOIN ile customer ve staff full_name'leri ekle
+        query = f"""
+            SELECT
+                a.id, a.business_id, a.customer_id, a.staff_id, 
+                a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
+                a.created_at, a.updated_at,
+                c.full_name AS customer_full_name,
+                s.full_name AS staff_full_name
+                {services_column}
+            FROM appointments a
+            LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
+            LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
+            WHERE {where_clause}
+            ORDER BY a.appointment_date ASC
+        """
+    else:
+        # Sadece appointments tablosu
+        query = f"""
+            SELECT id, business_id, customer_id, staff_id, 
+                   appointment_date, status, notes, admin_note, staff_note, customer_note, 
+                   created_at, updated_at,
+                   NULL AS customer_full_name,
+                   NULL AS staff_full_name
+                   {services_column}
+            FROM appointments a
+            WHERE {where_clause}
+            ORDER BY appointment_date ASC
+        """
+    if has_limit:
+        query += " LIMIT %s"
+    return query, len(where_conditions) - 1
+
+
+def _finish_list_row(row: dict, include_services: bool) -> dict:
+    """List satırını AppointmentResponse şekline getirir (services JSON parse, transaction yok)."""
+    if include_services:
+        row['services'] = _load_services_json(row.pop('services_json', None))
+    else:
+        row['services'] = None
+    row['transaction'] = None
+    return row
+
+
+async def _stream_appointments(
+    stack: AsyncExitStack,
+    conn,
+    cursor,
+    include_services: bool,
+    business_id: int,
+    filter_count: int
+) -> AsyncIterator[bytes]:
+    """
+    SSDictCursor satırlarını JSON array olarak stream eder. Her batch AppointmentResponse
+    listesi olarak validate edilip serialize edilir (endpoint'in response_model'i ile aynı şema).
+    Connection/cursor (stack) stream bitince veya client koparsa kapatılır.
+    Header'lar gittikten sonra oluşan hata 500'e çevrilemez: error log'lanır, connection
+    pool'a dönmeden kapatılır ve exception yeniden fırlatılır (server response'u keser,
+    client `]` ile kapanmış "başarılı" bir array görmez).
+    """
+    row_count = 0
+    completed = False
+    try:
+        yield b"["
+        while True:
+            rows = await cursor.fetchmany(_STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                _finish_list_row(row, include_services)
+            # Batch tek seferde validate + serialize edilir (pydantic-core, satır başına
+            # model_dump + orjson yok); dump_json "[...]" döner, dış köşeli parantezler atılır
+            batch_json = _APPOINTMENT_LIST_ADAPTER.dump_json(
+                _APPOINTMENT_LIST_ADAPTER.validate_python(rows)
+            )[1:-1]
+            yield (b"," + batch_json) if row_count else batch_json
+            row_count += len(rows)
+        yield b"]"
+        completed = True
+    except Exception:
+        logger.error(
+            "list_appointments stream failed business_id=%s rows_sent=%d",
+            business_id, row_count, exc_info=True
+        )
+        raise
+    finally:
+        if not completed:
+            # Hata ya da client kopması: yarım okunmuş unbuffered result drain edilmez,
+            # connection kapatılır (pool'a kullanılamaz durumda dönmez)
+            conn.close()
+        try:
+            await stack.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing list_appointments stream connection: {str(e)}")
+        logger.info(
+            "list_appointments business_id=%s filters=%d rows=%d streamed=True",
+            business_id, filter_count, row_count
+        )
+
+
+@router.get("/", response_model=List[AppointmentResponse], response_class=ORJSONResponse, summary="List appointments", description="Get all appointments for the authenticated business, optionally including services")
 async def list_appointments(
     request: Request,  # For accessing request URL - must be first (no default value)
     current_user: dict = Depends(get_current_user),
@@ -325,7 +714,8 @@ async def list_appointments(
     staff_id: Optional[List[int]] = Query(None, description="Filter by staff ID (can be multiple)"),
     customer_id: Optional[List[int]] = Query(None, description="Filter by customer ID (can be multiple)"),
     statuses: Optional[List[str]] = Query(None, alias="status", description="Filter by status (can be multiple)"),
-    service_id: Optional[List[int]] = Query(None, description="Filter by service ID (can be multiple)")
+    service_id: Optional[List[int]] = Query(None, description="Filter by service ID (can be multiple)"),
+    limit: Optional[int] = Query(None, ge=1, le=_LIST_MAX_LIMIT, description="Maximum number of appointments to return")
 ):
     # business_id kontrolü
     business_id = current_user.get("business_id")
@@ -347,208 +737,90 @@ async def list_appointments(
         # Staff için staff_id filtresini zorunlu kıl (frontend'den gelen filtreyi override et)
         staff_id = [user_staff_id]
     
-    # Log request URL for debugging
-    logger.info(f"Request URL: {request.url}")
-    logger.info(f"Query string: {request.url.query}")
-    
     # FastAPI automatically converts single values to lists for List[int] parameters
     # So staff_id, customer_id, service_id are already lists or None
     # statuses is also already a list or None (using alias="status" for query parameter)
     
-    # Debug logging - log raw parameters
-    logger.info("=" * 80)
-    logger.info("FILTER DEBUG - Raw parameters received:")
-    logger.info(f"  staff_id: {staff_id} (type: {type(staff_id)})")
-    logger.info(f"  customer_id: {customer_id} (type: {type(customer_id)})")
-    logger.info(f"  statuses: {statuses} (type: {type(statuses)})")
-    logger.info(f"  service_id: {service_id} (type: {type(service_id)})")
-    logger.info(f"  start_date: {start_date}")
-    logger.info(f"  end_date: {end_date}")
-    logger.info("=" * 80)
+    # Exclude pending and rejected appointments from list UNLESS they are explicitly requested in status filter
+    # This allows appointment-requests page to fetch pending/rejected, but excludes them from regular appointments list
+    should_exclude_pending_rejected = True
+    if statuses is not None and len(statuses) > 0:
+        # If status filter includes pending or rejected, don't exclude them (for appointment-requests page)
+        if 'pending' in statuses or 'rejected' in statuses:
+            should_exclude_pending_rejected = False
     
-    # Use get_connection() context manager for connection with ping check
-    async with get_connection() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # Build WHERE conditions dynamically
-            where_conditions = ["a.business_id = %s"]
-            query_params = [business_id]
-            
-            # Exclude pending and rejected appointments from list UNLESS they are explicitly requested in status filter
-            # This allows appointment-requests page to fetch pending/rejected, but excludes them from regular appointments list
-            should_exclude_pending_rejected = True
-            if statuses is not None and len(statuses) > 0:
-                # If status filter includes pending or rejected, don't exclude them (for appointment-requests page)
-                if 'pending' in statuses or 'rejected' in statuses:
-                    should_exclude_pending_rejected = False
-            
-            if should_exclude_pending_rejected:
-                # Exclude pending and rejected (for appointments list page)
-                where_conditions.append("a.status NOT IN ('pending', 'rejected')")
-            
-            # Date range filters
-            if start_date:
-                where_conditions.append("DATE(a.appointment_date) >= %s")
-                query_params.append(start_date)
-            if end_date:
-                where_conditions.append("DATE(a.appointment_date) < %s")
-                query_params.append(end_date)
-            
-            # Staff filter (can be multiple)
-            if staff_id is not None and len(staff_id) > 0:
-                placeholders = ','.join(['%s'] * len(staff_id))
-                where_conditions.append(f"a.staff_id IN ({placeholders})")
-                query_params.extend(staff_id)
-                logger.info(f"  -> Added staff_id filter: IN ({placeholders}) with values: {staff_id}")
-            
-            # Customer filter (can be multiple)
-            if customer_id is not None and len(customer_id) > 0:
-                placeholders = ','.join(['%s'] * len(customer_id))
-                where_conditions.append(f"a.customer_id IN ({placeholders})")
-                query_params.extend(customer_id)
-                logger.info(f"  -> Added customer_id filter: IN ({placeholders}) with values: {customer_id}")
-            
-            # Status filter (can be multiple) - using statuses variable (aliased as "status" in query)
-            if statuses is not None and len(statuses) > 0:
-                placeholders = ','.join(['%s'] * len(statuses))
-                where_conditions.append(f"a.status IN ({placeholders})")
-                query_params.extend(statuses)
-                logger.info(f"  -> Added status filter: IN ({placeholders}) with values: {statuses}")
-            
-            # Service filter (requires JOIN with appointment_services)
-            service_filter_join = ""
-            if service_id is not None and len(service_id) > 0:
-                service_filter_join = """
-                    INNER JOIN appointment_services aps_filter ON aps_filter.appointment_id = a.id
-                """
-                placeholders = ','.join(['%s'] * len(service_id))
-                where_conditions.append(f"aps_filter.service_id IN ({placeholders})")
-                query_params.extend(service_id)
-                logger.info(f"  -> Added service_id filter: IN ({placeholders}) with values: {service_id}")
-            
-            where_clause = " AND ".join(where_conditions)
-            
-            # Debug logging for WHERE clause
-            logger.info("=" * 80)
-            logger.info("SQL DEBUG - WHERE clause and parameters:")
-            logger.info(f"  WHERE conditions count: {len(where_conditions)}")
-            logger.info(f"  WHERE clause: {where_clause}")
-            logger.info(f"  Query params count: {len(query_params)}")
-            logger.info(f"  Query params: {query_params}")
-            logger.info("=" * 80)
-            
-            # Base SELECT query oluştur
-            if include_names:
-                # JOIN ile customer ve staff full_name'leri ekle
-                # DISTINCT kullanarak duplicate row'ları önle
-                query = f"""
-                    SELECT DISTINCT
-                        a.id, a.business_id, a.customer_id, a.staff_id, 
-                        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                        a.created_at, a.updated_at,
-                        c.full_name AS customer_full_name,
-                        s.full_name AS staff_full_name
-                    FROM appointments a
-                    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                    {service_filter_join}
-                    WHERE {where_clause}
-                    ORDER BY a.appointment_date ASC
-                """
-                # business_id'yi iki kez ekle (JOIN'ler için)
-                final_params = [business_id, business_id] + query_params
-                logger.info("=" * 80)
-                logger.info("SQL DEBUG - Final query execution:")
-                logger.info(f"  Final query:\n{query}")
-                logger.info(f"  Final params count: {len(final_params)}")
-                logger.info(f"  Final params: {final_params}")
-                logger.info("=" * 80)
+    # SQL filtre imzasından (cache'li) derlenir; parametreler aynı sırayla her request'te bağlanır
+    query, filter_count = _compile_list_query(
+        include_names,
+        include_services,
+        should_exclude_pending_rejected,
+        bool(start_date),
+        bool(end_date),
+        bool(staff_id),
+        bool(customer_id),
+        len(statuses) if statuses else 0,
+        bool(service_id),
+        limit is not None,
+    )
+    
+    final_params = [business_id, business_id] if include_names else []
+    final_params.append(business_id)
+    start = _parse_date_param(start_date, "start_date") if start_date else None
+    end = _parse_date_param(end_date, "end_date") if end_date else None
+    if start:
+        final_params.append(start)
+    if end:
+        final_params.append(end)
+    if staff_id:
+        final_params.append(json_ids(staff_id))
+    if customer_id:
+        final_params.append(json_ids(customer_id))
+    if statuses:
+        final_params.extend(statuses)
+    if service_id:
+        final_params.append(json_ids(service_id))
+    if limit is not None:
+        final_params.append(limit)
+    
+    # Parametre dökümü sadece DEBUG aktifse (repr maliyeti her request'te ödenmesin)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("list_appointments url=%s query=%s params=%r", request.url, query, final_params)
+    
+    # Read-only: replica pool (tanımlıysa) üzerinden okunur.
+    # Sınırlı sonuç (limit ya da kısa tarih aralığı): fetchall + normal response. Connection
+    # sorgu bitince pool'a döner (yavaş client connection tutmaz), hata olursa normal HTTP hatası
+    bounded = limit is not None or (
+        start is not None and end is not None and (end - start).days <= _LIST_BUFFERED_MAX_DAYS
+    )
+    if bounded:
+        async with get_readonly_connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
                 await cursor.execute(query, tuple(final_params))
-            else:
-                # Sadece appointments tablosu
-                query = f"""
-                    SELECT id, business_id, customer_id, staff_id, 
-                           appointment_date, status, notes, admin_note, staff_note, customer_note, 
-                           created_at, updated_at
-                    FROM appointments a
-                    {service_filter_join}
-                    WHERE {where_clause}
-                    ORDER BY appointment_date ASC
-                """
-                logger.info("=" * 80)
-                logger.info("SQL DEBUG - Final query execution (no names):")
-                logger.info(f"  Final query:\n{query}")
-                logger.info(f"  Final params count: {len(query_params)}")
-                logger.info(f"  Final params: {query_params}")
-                logger.info("=" * 80)
-                await cursor.execute(query, tuple(query_params))
-            
-            appointments = await cursor.fetchall()
-            
-            logger.info("=" * 80)
-            logger.info(f"SQL DEBUG - Query result: {len(appointments)} appointments found")
-            logger.info("=" * 80)
-            
-            # include_services=true ise appointment_services + services bilgilerini ekle
-            if include_services and appointments:
-                appointment_ids = [appt['id'] for appt in appointments]
-                
-                # Tenant-safe query: appointments tablosu ile JOIN yaparak business_id kontrolü
-                # LEFT JOIN kullanarak services olmasa bile appointment'ları döndür
-                placeholders = ','.join(['%s'] * len(appointment_ids))
-                services_query = f"""
-                    SELECT 
-                        aps.appointment_id,
-                        aps.service_id,
-                        s.name,
-                        s.duration_minutes,
-                        aps.price,
-                        aps.created_at
-                    FROM appointments a
-                    LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                    LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                    WHERE a.business_id = %s AND a.id IN ({placeholders})
-                    ORDER BY aps.appointment_id, aps.created_at
-                """
-                await cursor.execute(services_query, (business_id, *appointment_ids))
-                services_data = await cursor.fetchall()
-                
-                # appointment_id'ye göre grupla (NULL service_id'leri filtrele)
-                services_by_appointment = {}
-                for service in services_data:
-                    appointment_id = service['appointment_id']
-                    # Skip if service_id is NULL (LEFT JOIN result when no appointment_services exists)
-                    if service['service_id'] is None:
-                        continue
-                    if appointment_id not in services_by_appointment:
-                        services_by_appointment[appointment_id] = []
-                    services_by_appointment[appointment_id].append({
-                        'service_id': service['service_id'],
-                        'name': service['name'],
-                        'duration_minutes': service['duration_minutes'],
-                        'price': service['price'],
-                        'created_at': service['created_at']
-                    })
-                
-                # Her appointment'a services alanı ekle (services yoksa boş array)
-                for appt in appointments:
-                    appointment_id = appt['id']
-                    if appointment_id in services_by_appointment:
-                        appt['services'] = services_by_appointment[appointment_id]
-                    else:
-                        appt['services'] = []
-            
-            # include_names=false ise customer_full_name ve staff_full_name key'lerini kaldır
-            if not include_names:
-                for appt in appointments:
-                    appt.pop('customer_full_name', None)
-                    appt.pop('staff_full_name', None)
-            
-            # include_services=false ise services key'ini kaldır
-            if not include_services:
-                for appt in appointments:
-                    appt.pop('services', None)
-            
-            return appointments
+                rows = await cursor.fetchall()
+        for row in rows:
+            _finish_list_row(row, include_services)
+        logger.info(
+            "list_appointments business_id=%s filters=%d rows=%d streamed=False",
+            business_id, filter_count, len(rows)
+        )
+        return rows
+    
+    # Açık uçlu / uzun aralık: server-side (unbuffered) cursor, satırlar fetchall() ile belleğe
+    # alınmadan parça parça okunup JSON array olarak stream edilir. Sorgu response başlamadan
+    # çalıştırılır ki pool/SQL hataları hâlâ normal HTTP hatası olarak dönebilsin.
+    stack = AsyncExitStack()
+    try:
+        conn = await stack.enter_async_context(get_readonly_connection())
+        cursor = await stack.enter_async_context(conn.cursor(aiomysql.SSDictCursor))
+        await cursor.execute(query, tuple(final_params))
+    except BaseException:
+        await stack.aclose()
+        raise
+    
+    return StreamingResponse(
+        _stream_appointments(stack, conn, cursor, include_services, business_id, filter_count),
+        media_type="application/json"
+    )
 
 @router.get("/activities", response_model=List[AppointmentResponse], summary="Get activities", description="Get today's appointments for activities drawer. Staff sees only their appointments, Admin/Owner sees all appointments")
 async def get_activities(
@@ -561,7 +833,6 @@ async def get_activities(
     - Admin/Owner: Bugünün tüm randevularını görür
     """
     business_id = current_user.get("business_id")
-    user_id = current_user.get("id")
     user_role = current_user.get("role")
     
     if business_id is None:
@@ -570,112 +841,37 @@ async def get_activities(
             detail="Invalid token payload"
         )
     
-    # Use get_connection() context manager for connection with ping check
-    async with get_connection() as conn:
+    # Staff ise staff_id get_current_user'da çözülmüş olarak gelir (ayrı staff sorgusu yok)
+    staff_id_filter = None
+    if user_role == 'staff':
+        staff_id_filter = current_user.get("staff_id")
+        if staff_id_filter is None:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Staff user must have a linked staff profile"
+            )
+    
+    # Read-only endpoint: replica pool (tanımlıysa) üzerinden okunur
+    async with get_readonly_connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # Staff ise, user_id'ye bağlı staff_id bul
-            staff_id_filter = None
-            if user_role == 'staff':
-                await cursor.execute(
-                    "SELECT id FROM staff WHERE business_id = %s AND user_id = %s LIMIT 1",
-                    (business_id, user_id)
-                )
-                staff_result = await cursor.fetchone()
-                if not staff_result:
-                    # Staff user ama staff tablosunda kayıt yok, boş liste döndür
-                    return []
-                staff_id_filter = staff_result['id']
-            
-            # Query oluştur - Sadece bugünün randevuları
+            # Sadece bugünün randevuları (sabit SQL metinleri, bkz. _TODAY_*_SQL)
             if staff_id_filter:
                 # Staff: Sadece bugünün kendi randevuları
-                query = """
-                    SELECT 
-                        a.id, a.business_id, a.customer_id, a.staff_id, 
-                        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                        a.created_at, a.updated_at,
-                        c.full_name AS customer_full_name,
-                        s.full_name AS staff_full_name
-                    FROM appointments a
-                    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                    WHERE a.business_id = %s 
-                      AND a.staff_id = %s
-                      AND DATE(a.appointment_date) = CURDATE()
-                    ORDER BY a.appointment_date ASC
-                    LIMIT %s
-                """
-                await cursor.execute(query, (business_id, business_id, business_id, staff_id_filter, limit))
+                await cursor.execute(
+                    _TODAY_STAFF_APPOINTMENTS_SQL,
+                    (business_id, business_id, business_id, staff_id_filter, limit)
+                )
             else:
                 # Admin/Owner: Bugünün tüm randevuları
-                query = """
-                    SELECT 
-                        a.id, a.business_id, a.customer_id, a.staff_id, 
-                        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                        a.created_at, a.updated_at,
-                        c.full_name AS customer_full_name,
-                        s.full_name AS staff_full_name
-                    FROM appointments a
-                    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                    WHERE a.business_id = %s
-                      AND DATE(a.appointment_date) = CURDATE()
-                    ORDER BY a.appointment_date ASC
-                    LIMIT %s
-                """
-                await cursor.execute(query, (business_id, business_id, business_id, limit))
+                await cursor.execute(
+                    _TODAY_APPOINTMENTS_SQL,
+                    (business_id, business_id, business_id, limit)
+                )
             
             appointments = await cursor.fetchall()
             
-            if not appointments:
-                return []
-            
-            # Services bilgilerini çek (LEFT JOIN kullanarak services olmasa bile appointment dönsün)
-            appointment_ids = [appt['id'] for appt in appointments]
-            if appointment_ids:
-                placeholders = ','.join(['%s'] * len(appointment_ids))
-                await cursor.execute(
-                    f"""
-                    SELECT 
-                        a.id as appointment_id,
-                        aps.service_id,
-                        s.name,
-                        s.duration_minutes,
-                        aps.price,
-                        aps.created_at
-                    FROM appointments a
-                    LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                    LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                    WHERE a.business_id = %s AND a.id IN ({placeholders})
-                    ORDER BY a.id, aps.created_at
-                    """,
-                    (business_id, *appointment_ids)
-                )
-                services_data = await cursor.fetchall()
-                
-                # Services'leri appointment'lara ekle (NULL service_id'leri filtrele)
-                services_by_appointment = {}
-                for service in services_data:
-                    appointment_id = service['appointment_id']
-                    # Skip if service_id is NULL (LEFT JOIN result when no appointment_services exists)
-                    if service['service_id'] is None:
-                        continue
-                    if appointment_id not in services_by_appointment:
-                        services_by_appointment[appointment_id] = []
-                    services_by_appointment[appointment_id].append({
-                        'service_id': service['service_id'],
-                        'name': service['name'],
-                        'duration_minutes': service['duration_minutes'],
-                        'price': service['price'],
-                        'created_at': service['created_at']
-                    })
-                
-                for appt in appointments:
-                    appointment_id = appt['id']
-                    appt['services'] = services_by_appointment.get(appointment_id, [])
-            else:
-                for appt in appointments:
-                    appt['services'] = []
+            for appt in appointments:
+                appt['services'] = _load_services_json(appt.pop('services_json'))
             
             return appointments
 
@@ -707,9 +903,6 @@ async def get_available_slots_endpoint(
             detail="Database pool is not initialized"
         )
     
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         from app.services.availability_service import get_available_slots
         result = await get_available_slots(
@@ -771,34 +964,10 @@ async def get_appointment(
     # Use get_connection() context manager for connection with ping check
     async with get_connection() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # Appointment bilgilerini customer ve staff full_name'leri ile birlikte çek
-            where_conditions = ["a.id = %s", "a.business_id = %s"]
-            query_params = [appointment_id, business_id]
-            
-            # Staff için staff_id kontrolü ekle
-            if user_role == "staff" and user_staff_id is not None:
-                where_conditions.append("a.staff_id = %s")
-                query_params.append(user_staff_id)
-            
-            where_clause = " AND ".join(where_conditions)
-            
-            await cursor.execute(
-                f"""
-                SELECT 
-                    a.id, a.business_id, a.customer_id, a.staff_id, 
-                    a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                    a.created_at, a.updated_at,
-                    c.full_name AS customer_full_name,
-                    s.full_name AS staff_full_name
-                FROM appointments a
-                LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                WHERE {where_clause}
-                LIMIT 1
-                """,
-                (business_id, business_id, *query_params)
+            # Appointment + customer/staff full_name + services (JSON_ARRAYAGG) + transaction tek round-trip
+            appointment = await _load_appointment_full(
+                cursor, business_id, appointment_id, user_staff_id, include_services
             )
-            appointment = await cursor.fetchone()
             
             if not appointment:
                 raise HTTPException(
@@ -806,76 +975,9 @@ async def get_appointment(
                     detail="Appointment not found"
                 )
             
-            # Services bilgilerini çek (include_services=True ise)
-            if include_services:
-                # LEFT JOIN kullanarak services olmasa bile appointment dönsün
-                await cursor.execute(
-                    """
-                    SELECT 
-                        aps.service_id,
-                        s.name,
-                        s.duration_minutes,
-                        aps.price,
-                        aps.created_at
-                    FROM appointments a
-                    LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                    LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                    WHERE a.business_id = %s AND a.id = %s
-                    ORDER BY aps.created_at
-                    """,
-                    (business_id, appointment_id)
-                )
-                services_data = await cursor.fetchall()
-                
-                # Services alanını ekle (NULL service_id'leri filtrele)
-                appointment['services'] = [
-                    {
-                        'service_id': s['service_id'],
-                        'name': s['name'],
-                        'duration_minutes': s['duration_minutes'],
-                        'price': s['price'],
-                        'created_at': s['created_at']
-                    }
-                    for s in services_data if s['service_id'] is not None
-                ]
-            else:
-                appointment['services'] = None
-            
-            # Transaction bilgisini çek (eğer varsa) - LEFT JOIN ile tek query'de
-            try:
-                await cursor.execute(
-                    """
-                    SELECT 
-                        t.id, t.business_id, t.appointment_id, t.customer_id, 
-                        t.amount, t.payment_method, t.status, t.transaction_date, t.created_at
-                    FROM appointments a
-                    LEFT JOIN transactions t ON t.appointment_id = a.id AND t.business_id = a.business_id
-                    WHERE a.id = %s AND a.business_id = %s
-                    LIMIT 1
-                    """,
-                    (appointment_id, business_id)
-                )
-                result = await cursor.fetchone()
-                
-                if result and result.get('id') is not None:  # Transaction exists (t.id is not NULL)
-                    appointment['transaction'] = {
-                        'id': result['id'],
-                        'amount': float(result['amount']),
-                        'payment_method': result['payment_method'],
-                        'status': result['status'],
-                        'transaction_date': result['transaction_date'].isoformat() if result['transaction_date'] else None,
-                        'created_at': result['created_at'].isoformat() if result['created_at'] else None
-                    }
-                else:
-                    appointment['transaction'] = None
-            except Exception as e:
-                # If transaction query fails, set transaction to None (don't break the appointment response)
-                logger.warning(f"Failed to fetch transaction for appointment {appointment_id}: {str(e)}")
-                appointment['transaction'] = None
-            
             return appointment
 
-@router.put("/{appointment_id}", response_model=AppointmentResponse, summary="Update appointment", description="Update an existing appointment with double-booking prevention")
+@router.put("/{appointment_id}", response_model=AppointmentResponse, response_class=ORJSONResponse, summary="Update appointment", description="Update an existing appointment with double-booking prevention")
 async def update_appointment(
     appointment_id: int,
     appointment_data: AppointmentUpdate,
@@ -911,21 +1013,11 @@ async def update_appointment(
             
             async with conn.cursor(aiomysql.DictCursor) as cursor:
                 # Mevcut randevuyu kontrol et (tenant-safe)
-                where_conditions = ["id = %s", "business_id = %s"]
-                query_params = [appointment_id, business_id]
-                
-                # Staff için staff_id kontrolü ekle
-                if user_role == "staff" and user_staff_id is not None:
-                    where_conditions.append("staff_id = %s")
-                    query_params.append(user_staff_id)
-                
-                where_clause = " AND ".join(where_conditions)
-                
-                await cursor.execute(
-                    f"SELECT id, customer_id, staff_id, appointment_date, status FROM appointments WHERE {where_clause} LIMIT 1",
-                    tuple(query_params)
+                # Response commit sonrası re-read yerine bu satırdan kurulur: names, services ve
+                # transaction da aynı sorguda okunur
+                existing_appointment = await _load_appointment_full(
+                    cursor, business_id, appointment_id, user_staff_id
                 )
-                existing_appointment = await cursor.fetchone()
                 
                 if not existing_appointment:
                     raise HTTPException(
@@ -933,6 +1025,9 @@ async def update_appointment(
                         detail="Appointment not found"
                     )
                 
+                existing_services = existing_appointment.pop('services')
+                existing_transaction = existing_appointment.pop('transaction')
+                
                 # Staff için staff_id değiştirilemez
                 if user_role == "staff" and appointment_data.staff_id is not None:
                     if appointment_data.staff_id != user_staff_id:
@@ -953,22 +1048,20 @@ async def update_appointment(
                     update_staff_id = appointment_data.staff_id if appointment_data.staff_id is not None else existing_appointment['staff_id']
                 update_appointment_date = appointment_data.appointment_date if appointment_data.appointment_date is not None else existing_appointment['appointment_date']
                 
-                # Customer ve Staff'ın aynı business'a ait olduğunu kontrol et
+                # Customer ve Staff'ın aynı business'a ait olduğunu kontrol et (tek round-trip)
+                # (full_name response için de kullanılır)
                 await cursor.execute(
-                    "SELECT id FROM customers WHERE id = %s AND business_id = %s LIMIT 1",
-                    (update_customer_id, business_id)
+                    _UPDATE_VALIDATION_SQL,
+                    (update_customer_id, business_id, update_staff_id, business_id)
                 )
-                if not await cursor.fetchone():
+                names = {row['kind']: row['name'] for row in await cursor.fetchall()}
+                if 'customer' not in names:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
                         detail="Customer not found"
                     )
                 
-                await cursor.execute(
-                    "SELECT id FROM staff WHERE id = %s AND business_id = %s AND is_active = TRUE LIMIT 1",
-                    (update_staff_id, business_id)
-                )
-                if not await cursor.fetchone():
+                if 'staff' not in names:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
                         detail="Staff not found or inactive"
@@ -984,10 +1077,9 @@ async def update_appointment(
                             detail="service_ids cannot be empty"
                         )
                     
-                    placeholders = ','.join(['%s'] * len(unique_service_ids))
                     await cursor.execute(
-                        f"SELECT id, price FROM services WHERE id IN ({placeholders}) AND business_id = %s AND is_active = TRUE",
-                        (*unique_service_ids, business_id)
+                        _UPDATE_SERVICES_VALIDATION_SQL,
+                        (json_ids(unique_service_ids), business_id)
                     )
                     services = await cursor.fetchall()
                     
@@ -997,12 +1089,7 @@ async def update_appointment(
                             detail="One or more services not found or inactive"
                         )
                 else:
-                    # Mevcut service_ids'i al
-                    await cursor.execute(
-                        "SELECT service_id FROM appointment_services WHERE appointment_id = %s",
-                        (appointment_id,)
-                    )
-                    existing_services = await cursor.fetchall()
+                    # Mevcut service_ids (ilk SELECT'teki services_json'dan)
                     unique_service_ids = [s['service_id'] for s in existing_services]
                 
                 # Double-booking kontrolü (sadece date veya staff değiştiyse)
@@ -1027,63 +1114,54 @@ async def update_appointment(
                             detail=str(e)
                         )
                 
-                # Appointment'ı güncelle
+                # Appointment'ı güncelle (changes: response için yeni kolon değerleri)
                 update_fields = []
                 update_values = []
+                changes = {}
                 
                 if appointment_data.customer_id is not None:
                     update_fields.append("customer_id = %s")
                     update_values.append(appointment_data.customer_id)
+                    changes['customer_id'] = appointment_data.customer_id
                 if appointment_data.staff_id is not None:
                     update_fields.append("staff_id = %s")
                     update_values.append(appointment_data.staff_id)
+                    changes['staff_id'] = appointment_data.staff_id
                 if appointment_data.appointment_date is not None:
                     update_fields.append("appointment_date = %s")
                     update_values.append(appointment_data.appointment_date)
+                    changes['appointment_date'] = appointment_data.appointment_date
                 if appointment_data.notes is not None:
                     update_fields.append("notes = %s")
                     update_values.append(appointment_data.notes)
+                    changes['notes'] = appointment_data.notes
                 
-                # admin_note ve staff_note için boş string'i None'a çevir
-                if appointment_data.admin_note is not None:
-                    admin_note_value = appointment_data.admin_note.strip() if appointment_data.admin_note and appointment_data.admin_note.strip() else None
-                    update_fields.append("admin_note = %s")
-                    update_values.append(admin_note_value)
-                
-                if appointment_data.staff_note is not None:
-                    staff_note_value = appointment_data.staff_note.strip() if appointment_data.staff_note and appointment_data.staff_note.strip() else None
-                    update_fields.append("staff_note = %s")
-                    update_values.append(staff_note_value)
-                
-                if appointment_data.customer_note is not None:
-                    customer_note_value = appointment_data.customer_note.strip() if appointment_data.customer_note and appointment_data.customer_note.strip() else None
-                    update_fields.append("customer_note = %s")
-                    update_values.append(customer_note_value)
+                # admin_note, staff_note ve customer_note için boş string'i None'a çevir
+                for note_field in _NOTE_FIELDS:
+                    raw_note = getattr(appointment_data, note_field)
+                    if raw_note is not None:
+                        note_value = _clean_note(raw_note)
+                        update_fields.append(f"{note_field} = %s")
+                        update_values.append(note_value)
+                        changes[note_field] = note_value
                 
                 if appointment_data.status is not None:
                     # Eğer status "completed" olarak değiştiriliyorsa, transaction kontrolü yap
                     # Mevcut status'ü kontrol et - eğer zaten completed ise kontrol yapma
-                    await cursor.execute(
-                        "SELECT status FROM appointments WHERE id = %s AND business_id = %s LIMIT 1",
-                        (appointment_id, business_id)
-                    )
-                    current_appointment = await cursor.fetchone()
-                    current_status = current_appointment['status'] if current_appointment else None
+                    # (status aynı transaction içindeki ilk SELECT'ten)
+                    current_status = existing_appointment['status']
                     
                     if appointment_data.status == 'completed' and current_status != 'completed':
                         # Status completed olarak değiştiriliyor, transaction kontrolü yap
-                        await cursor.execute(
-                            "SELECT id FROM transactions WHERE appointment_id = %s AND business_id = %s LIMIT 1",
-                            (appointment_id, business_id)
-                        )
-                        transaction = await cursor.fetchone()
-                        if not transaction:
+                        # (transaction ilk SELECT'te LEFT JOIN ile okundu)
+                        if existing_transaction is None:
                             raise HTTPException(
                                 status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="Cannot mark appointment as completed without a transaction. Please add payment details first."
                             )
                     update_fields.append("status = %s")
                     update_values.append(appointment_data.status)
+                    changes['status'] = appointment_data.status
                 
                 if update_fields:
                     update_fields.append("updated_at = CURRENT_TIMESTAMP")
@@ -1102,104 +1180,42 @@ async def update_appointment(
                     )
                     
                     # Yeni services'i ekle
-                    for service in services:
-                        await cursor.execute(
-                            "INSERT INTO appointment_services (appointment_id, service_id, price) VALUES (%s, %s, %s)",
-                            (appointment_id, service['id'], service['price'])
-                        )
-                
-                await conn.commit()
-            
-            # Commit sonrası SELECT (tenant-safe)
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute(
-                    """
-                    SELECT 
-                        a.id, a.business_id, a.customer_id, a.staff_id, 
-                        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                        a.created_at, a.updated_at,
-                        c.full_name AS customer_full_name,
-                        s.full_name AS staff_full_name
-                    FROM appointments a
-                    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                    WHERE a.id = %s AND a.business_id = %s
-                    LIMIT 1
-                    """,
-                    (business_id, business_id, appointment_id, business_id)
-                )
-                appointment = await cursor.fetchone()
-                
-                if not appointment:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Failed to retrieve updated appointment"
+                    # executemany tek bir multi-row INSERT'e çevrilir (service başına round-trip yok)
+                    await cursor.executemany(
+                        _INSERT_APPOINTMENT_SERVICE_SQL,
+                        [(appointment_id, service['id'], service['price']) for service in services]
                     )
                 
-                # Services bilgilerini çek (LEFT JOIN kullanarak services olmasa bile appointment dönsün)
-                await cursor.execute(
-                    """
-                    SELECT 
-                        aps.service_id,
-                        s.name,
-                        s.duration_minutes,
-                        aps.price,
-                        aps.created_at
-                    FROM appointments a
-                    LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                    LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                    WHERE a.business_id = %s AND a.id = %s
-                    ORDER BY aps.created_at
-                    """,
-                    (business_id, appointment_id)
-                )
-                services_data = await cursor.fetchall()
-                
-                # NULL service_id'leri filtrele
-                appointment['services'] = [
-                    {
-                        'service_id': s['service_id'],
-                        'name': s['name'],
-                        'duration_minutes': s['duration_minutes'],
-                        'price': s['price'],
-                        'created_at': s['created_at']
-                    }
-                    for s in services_data if s['service_id'] is not None
-                ]
+                # Response bellekte kurulur (mevcut satır + değişiklikler); commit sonrası re-read yok.
+                # Bir şey yazıldıysa DB'nin atadığı değerler (updated_at, saniyeye yuvarlanmış
+                # appointment_date, yeni services created_at) aynı transaction içinde tek PK sorgusuyla okunur.
+                appointment = {**existing_appointment, **changes}
+                appointment['customer_full_name'] = names['customer']
+                appointment['staff_full_name'] = names['staff']
+                appointment['services'] = existing_services
+                appointment['transaction'] = existing_transaction
                 
-                # Transaction bilgisini çek (eğer varsa) - LEFT JOIN ile tek query'de
-                try:
-                    await cursor.execute(
-                        """
-                        SELECT 
-                            t.id, t.business_id, t.appointment_id, t.customer_id, 
-                            t.amount, t.payment_method, t.status, t.transaction_date, t.created_at
-                        FROM appointments a
-                        LEFT JOIN transactions t ON t.appointment_id = a.id AND t.business_id = a.business_id
-                        WHERE a.id = %s AND a.business_id = %s
-                        LIMIT 1
-                        """,
-                        (appointment_id, business_id)
-                    )
-                    result = await cursor.fetchone()
+                if update_fields or appointment_data.service_ids is not None:
+                    await cursor.execute(_WRITTEN_APPOINTMENT_VALUES_SQL, (appointment_id,))
+                    written_rows = await cursor.fetchall()
+                    appointment['appointment_date'] = written_rows[0]['appointment_date']
+                    appointment['updated_at'] = written_rows[0]['updated_at']
                     
-                    if result and result.get('id') is not None:  # Transaction exists (t.id is not NULL)
-                        appointment['transaction'] = {
-                            'id': result['id'],
-                            'amount': float(result['amount']),
-                            'payment_method': result['payment_method'],
-                            'status': result['status'],
-                            'transaction_date': result['transaction_date'].isoformat() if result['transaction_date'] else None,
-                            'created_at': result['created_at'].isoformat() if result['created_at'] else None
-                        }
-                    else:
-                        appointment['transaction'] = None
-                except Exception as e:
-                    # If transaction query fails, set transaction to None (don't break the appointment response)
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Failed to fetch transaction for appointment {appointment_id}: {str(e)}")
-                    appointment['transaction'] = None
+                    if appointment_data.service_ids is not None:
+                        service_created_at = {row['service_id']: row['service_created_at'] for row in written_rows}
+                        service_map = {s['id']: s for s in services}
+                        appointment['services'] = [
+                            {
+                                'service_id': service_id,
+                                'name': service_map[service_id]['name'],
+                                'duration_minutes': service_map[service_id]['duration_minutes'],
+                                'price': service_map[service_id]['price'],
+                                'created_at': service_created_at[service_id]
+                            }
+                            for service_id in unique_service_ids
+                        ]
+                
+                await conn.commit()
             
             return appointment
             
@@ -1213,7 +1229,7 @@ async def update_appointment(
                 detail=f"Failed to update appointment: {str(e)}"
             )
 
-@router.patch("/{appointment_id}/status", response_model=AppointmentResponse, summary="Update appointment status", description="Update only the status of an appointment (cancel, complete, etc.)")
+@router.patch("/{appointment_id}/status", response_model=AppointmentResponse, response_class=ORJSONResponse, summary="Update appointment status", description="Update only the status of an appointment (cancel, complete, etc.)")
 async def update_appointment_status(
     appointment_id: int,
     status_data: AppointmentStatusUpdate,
@@ -1244,67 +1260,33 @@ async def update_appointment_status(
     # Use get_connection() context manager for connection with ping check
     async with get_connection() as conn:
         try:
-            await conn.begin()
-            
+            # Ayrı BEGIN round-trip'i yok: pool autocommit=False, UPDATE transaction'ı implicit başlatır
+            # (pool'a transaction içinde dönen connection kapatıldığı için acquire edilen connection temiz)
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                # Mevcut randevuyu kontrol et (tenant-safe)
-                where_conditions = ["id = %s", "business_id = %s"]
-                query_params = [appointment_id, business_id]
-                
-                # Staff için staff_id kontrolü ekle
-                if user_role == "staff" and user_staff_id is not None:
-                    where_conditions.append("staff_id = %s")
-                    query_params.append(user_staff_id)
-                
-                where_clause = " AND ".join(where_conditions)
-                
+                # Status'u güncelle (tenant-safe); ayrı bir varlık SELECT'i yok, 404 rowcount'tan
                 await cursor.execute(
-                    f"SELECT id FROM appointments WHERE {where_clause} LIMIT 1",
-                    tuple(query_params)
+                    _UPDATE_APPOINTMENT_STATUS_SQL,
+                    (status_data.status, appointment_id, business_id, user_staff_id, user_staff_id)
                 )
-                if not await cursor.fetchone():
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="Appointment not found"
-                    )
-                
-                # Status'u güncelle
-                update_where_conditions = ["id = %s", "business_id = %s"]
-                update_query_params = [appointment_id, business_id]
-                
-                # Staff için staff_id kontrolü ekle
-                if user_role == "staff" and user_staff_id is not None:
-                    update_where_conditions.append("staff_id = %s")
-                    update_query_params.append(user_staff_id)
                 
-                update_where_clause = " AND ".join(update_where_conditions)
-                
-                await cursor.execute(
-                    f"UPDATE appointments SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE {update_where_clause}",
-                    (status_data.status, *update_query_params)
-                )
+                # MySQL rowcount eşleşen değil değişen satır sayısıdır: aynı status aynı saniye içinde
+                # tekrar yazılırsa 0 döner. Bu durumda satırın varlığı ayrıca kontrol edilir.
+                if cursor.rowcount == 0:
+                    await cursor.execute(
+                        _APPOINTMENT_EXISTS_SQL,
+                        (appointment_id, business_id, user_staff_id, user_staff_id)
+                    )
+                    if not await cursor.fetchone():
+                        raise HTTPException(
+                            status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Appointment not found"
+                        )
                 
-                await conn.commit()
-            
-            # Commit sonrası SELECT (tenant-safe)
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute(
-                    """
-                    SELECT 
-                        a.id, a.business_id, a.customer_id, a.staff_id, 
-                        a.appointment_date, a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, 
-                        a.created_at, a.updated_at,
-                        c.full_name AS customer_full_name,
-                        s.full_name AS staff_full_name
-                    FROM appointments a
-                    LEFT JOIN customers c ON a.customer_id = c.id AND c.business_id = %s
-                    LEFT JOIN staff s ON a.staff_id = s.id AND s.business_id = %s
-                    WHERE a.id = %s AND a.business_id = %s
-                    LIMIT 1
-                    """,
-                    (business_id, business_id, appointment_id, business_id)
-                )
-                appointment = await cursor.fetchone()
+                # Response aynı transaction içinde, UPDATE'ten hemen sonra okunur (commit sonrası re-read yok):
+                # kendi yazdığımız satırı görürüz ve commit sonrası açık kalan implicit transaction
+                # yüzünden connection pool'a dönerken kapatılmaz
+                # Appointment + names + services + transaction tek sorguda (tek round-trip)
+                appointment = await _load_appointment_full(cursor, business_id, appointment_id)
                 
                 if not appointment:
                     raise HTTPException(
@@ -1312,37 +1294,7 @@ async def update_appointment_status(
                         detail="Failed to retrieve updated appointment"
                     )
                 
-                # Services bilgilerini çek (LEFT JOIN kullanarak services olmasa bile appointment dönsün)
-                await cursor.execute(
-                    """
-                    SELECT 
-                        aps.service_id,
-                        s.name,
-                        s.duration_minutes,
-                        aps.price,
-                        aps.created_at
-                    FROM appointments a
-                    LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                    LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                    WHERE a.business_id = %s AND a.id = %s
-                    ORDER BY aps.created_at
-                    """,
-                    (business_id, appointment_id)
-                )
-                services_data = await cursor.fetchall()
-                
-                # NULL service_id'leri filtrele
-                # NULL service_id'leri filtrele
-                appointment['services'] = [
-                    {
-                        'service_id': s['service_id'],
-                        'name': s['name'],
-                        'duration_minutes': s['duration_minutes'],
-                        'price': s['price'],
-                        'created_at': s['created_at']
-                    }
-                    for s in services_data if s['service_id'] is not None
-                ]
+                await conn.commit()
             
             return appointment
             
@@ -1356,133 +1308,82 @@ async def update_appointment_status(
                 detail=f"Failed to update appointment status: {str(e)}"
             )
 
-@router.post("/{appointment_id}/approve", response_model=AppointmentResponse, summary="Approve pending appointment", description="Approve a pending appointment request (change status from 'pending' to 'scheduled')")
-async def approve_appointment(
-    appointment_id: int,
-    admin_note: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
-):
-    """Approve a pending appointment request"""
-    business_id = current_user.get("business_id")
-    if business_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
+async def _transition_pending_appointments(
+    business_id: int,
+    appointment_ids: List[int],
+    new_status: str,
+    admin_note: Optional[str],
+    action: str
+) -> List[dict]:
+    """
+    Pending appointment'ları tek transaction'da new_status'a çeker (tek UPDATE + tek read-back).
+    Biri bile yoksa 404, pending değilse 400 döner ve hiçbiri güncellenmez.
+    """
+    appointment_ids = list(dict.fromkeys(appointment_ids))
+    ids_json = json_ids(appointment_ids)
     
     try:
         async with get_connection() as conn:
             try:
-                await conn.begin()
-                
-                async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    # Check if appointment exists and is pending
-                    await cursor.execute(
-                        "SELECT id, status FROM appointments WHERE id = %s AND business_id = %s LIMIT 1",
-                        (appointment_id, business_id)
-                    )
-                    appointment = await cursor.fetchone()
-                    
-                    if not appointment:
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Appointment not found"
-                        )
-                    
-                    if appointment['status'] != 'pending':
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Appointment status is '{appointment['status']}', not 'pending'. Only pending appointments can be approved."
-                        )
-                    
-                    # Update status to 'scheduled'
-                    update_fields = ["status = 'scheduled'"]
-                    update_values = []
-                    
-                    if admin_note:
-                        update_fields.append("admin_note = %s")
-                        update_values.append(admin_note)
-                    
-                    update_fields.append("updated_at = CURRENT_TIMESTAMP")
-                    update_values.append(appointment_id)
-                    update_values.append(business_id)
-                    
-                    update_query = f"UPDATE appointments SET {', '.join(update_fields)} WHERE id = %s AND business_id = %s"
-                    await cursor.execute(update_query, tuple(update_values))
-                
-                await conn.commit()
-                
-                # Fetch updated appointment (reuse existing get_appointment logic)
+                # Ayrı BEGIN yok: autocommit=False pool'da UPDATE transaction'ı implicit başlatır
                 async with conn.cursor(aiomysql.DictCursor) as cursor:
                     await cursor.execute(
-                        """SELECT a.id, a.business_id, a.customer_id, a.staff_id, a.appointment_date, 
-                        a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, a.created_at, a.updated_at,
-                        c.full_name as customer_full_name, c.email as customer_email, c.phone as customer_phone,
-                        s.full_name as staff_full_name, s.email as staff_email, s.phone as staff_phone
-                        FROM appointments a
-                        LEFT JOIN customers c ON c.id = a.customer_id AND c.business_id = a.business_id
-                        LEFT JOIN staff s ON s.id = a.staff_id AND s.business_id = a.business_id
-                        WHERE a.business_id = %s AND a.id = %s LIMIT 1""",
-                        (business_id, appointment_id)
+                        _UPDATE_PENDING_APPOINTMENTS_SQL,
+                        (new_status, admin_note, business_id, ids_json)
                     )
-                    appointment = await cursor.fetchone()
                     
-                    if not appointment:
+                    # pending -> başka status her zaman satırı değiştirir, rowcount güvenilir.
+                    # Eksik kalan varsa UPDATE geri alınır (hepsi ya da hiçbiri) ve
+                    # 404 / 400 ayrımı için orijinal status'lar tek takip sorgusuyla okunur
+                    if cursor.rowcount != len(appointment_ids):
+                        await conn.rollback()
+                        await cursor.execute(_APPOINTMENT_STATUSES_BY_IDS_SQL, (business_id, ids_json))
+                        statuses = {row['id']: row['status'] for row in await cursor.fetchall()}
+                        
+                        for appointment_id in appointment_ids:
+                            if appointment_id not in statuses:
+                                raise HTTPException(
+                                    status_code=status.HTTP_404_NOT_FOUND,
+                                    detail="Appointment not found"
+                                )
+                        
+                        for appointment_id in appointment_ids:
+                            if statuses[appointment_id] != 'pending':
+                                raise HTTPException(
+                                    status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail=f"Appointment status is '{statuses[appointment_id]}', not 'pending'. Only pending appointments can be {action}d."
+                                )
+                        
+                        # Hepsi yine pending görünüyor: UPDATE ile takip okuması arasında eşzamanlı
+                        # bir değişiklik oldu. UPDATE geri alındı, başarı yoluna düşülmez
                         raise HTTPException(
-                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail="Failed to retrieve updated appointment"
+                            status_code=status.HTTP_409_CONFLICT,
+                            detail="Appointments changed concurrently, retry"
                         )
                     
-                    # Fetch services
+                    # Güncellenen appointment'lar aynı transaction içinde, commit öncesi okunur
+                    # header + services + transaction tek sorguda (id sayısından bağımsız tek round-trip)
                     await cursor.execute(
-                        """
-                        SELECT 
-                            aps.service_id,
-                            s.name,
-                            s.duration_minutes,
-                            aps.price,
-                            aps.created_at
-                        FROM appointments a
-                        LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                        LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                        WHERE a.business_id = %s AND a.id = %s
-                        ORDER BY aps.created_at
-                        """,
-                        (business_id, appointment_id)
+                        _APPOINTMENTS_DETAIL_BY_IDS_SQL,
+                        (business_id, business_id, business_id, ids_json)
                     )
-                    services_data = await cursor.fetchall()
-                    
-                    appointment['services'] = [
-                        {
-                            'service_id': s['service_id'],
-                            'name': s['name'],
-                            'duration_minutes': s['duration_minutes'],
-                            'price': s['price'],
-                            'created_at': s['created_at']
-                        }
-                        for s in services_data if s['service_id'] is not None
-                    ]
-                    
-                    # Fetch transaction if exists
-                    await cursor.execute(
-                        """SELECT id, amount, payment_method, status, transaction_date
-                        FROM transactions WHERE appointment_id = %s AND business_id = %s LIMIT 1""",
-                        (appointment_id, business_id)
-                    )
-                    transaction = await cursor.fetchone()
-                    appointment['transaction'] = transaction
+                    appointments = await cursor.fetchall()
+                    for appointment in appointments:
+                        appointment['services'] = _load_services_json(appointment.pop('services_json'))
+                        appointment['transaction'] = _pop_transaction(appointment)
                 
-                return appointment
+                await conn.commit()
+                return appointments
                 
             except HTTPException:
                 await conn.rollback()
                 raise
             except Exception as e:
                 await conn.rollback()
-                logger.exception("Error approving appointment")
+                logger.exception("Error trying to %s appointment(s)", action)
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to approve appointment: {str(e)}"
+                    detail=f"Failed to {action} appointment: {str(e)}"
                 )
     except RuntimeError:
         raise HTTPException(
@@ -1490,13 +1391,47 @@ async def approve_appointment(
             detail="Database pool is not initialized"
         )
 
-@router.post("/{appointment_id}/reject", response_model=AppointmentResponse, summary="Reject pending appointment", description="Reject a pending appointment request (change status to 'cancelled' with note)")
-async def reject_appointment(
+@router.post("/bulk-approve", response_model=List[AppointmentResponse], response_class=ORJSONResponse, summary="Approve pending appointments", description="Approve multiple pending appointment requests in a single transaction")
+async def bulk_approve_appointments(
+    bulk_data: AppointmentBulkAction,
+    current_user: dict = Depends(get_current_user)
+):
+    """Approve multiple pending appointment requests"""
+    business_id = current_user.get("business_id")
+    if business_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload"
+        )
+    
+    return await _transition_pending_appointments(
+        business_id, bulk_data.appointment_ids, 'scheduled', bulk_data.admin_note or None, "approve"
+    )
+
+@router.post("/bulk-reject", response_model=List[AppointmentResponse], response_class=ORJSONResponse, summary="Reject pending appointments", description="Reject multiple pending appointment requests in a single transaction")
+async def bulk_reject_appointments(
+    bulk_data: AppointmentBulkAction,
+    current_user: dict = Depends(get_current_user)
+):
+    """Reject multiple pending appointment requests"""
+    business_id = current_user.get("business_id")
+    if business_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload"
+        )
+    
+    return await _transition_pending_appointments(
+        business_id, bulk_data.appointment_ids, 'rejected', bulk_data.admin_note or "Rejected", "reject"
+    )
+
+@router.post("/{appointment_id}/approve", response_model=AppointmentResponse, response_class=ORJSONResponse, summary="Approve pending appointment", description="Approve a pending appointment request (change status from 'pending' to 'scheduled')")
+async def approve_appointment(
     appointment_id: int,
     admin_note: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Reject a pending appointment request"""
+    """Approve a pending appointment request"""
     business_id = current_user.get("business_id")
     if business_id is None:
         raise HTTPException(
@@ -1504,127 +1439,26 @@ async def reject_appointment(
             detail="Invalid token payload"
         )
     
-    try:
-        async with get_connection() as conn:
-            try:
-                await conn.begin()
-                
-                async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    # Check if appointment exists and is pending
-                    await cursor.execute(
-                        "SELECT id, status FROM appointments WHERE id = %s AND business_id = %s LIMIT 1",
-                        (appointment_id, business_id)
-                    )
-                    appointment = await cursor.fetchone()
-                    
-                    if not appointment:
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Appointment not found"
-                        )
-                    
-                    if appointment['status'] != 'pending':
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Appointment status is '{appointment['status']}', not 'pending'. Only pending appointments can be rejected."
-                        )
-                    
-                    # Update status to 'rejected' and add rejection note
-                    rejection_note = admin_note or "Rejected"
-                    update_fields = ["status = 'rejected'"]
-                    update_values = []
-                    
-                    if admin_note:
-                        update_fields.append("admin_note = %s")
-                        update_values.append(rejection_note)
-                    else:
-                        update_fields.append("admin_note = %s")
-                        update_values.append(rejection_note)
-                    
-                    update_fields.append("updated_at = CURRENT_TIMESTAMP")
-                    update_values.append(appointment_id)
-                    update_values.append(business_id)
-                    
-                    update_query = f"UPDATE appointments SET {', '.join(update_fields)} WHERE id = %s AND business_id = %s"
-                    await cursor.execute(update_query, tuple(update_values))
-                
-                await conn.commit()
-                
-                # Fetch updated appointment
-                async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    await cursor.execute(
-                        """SELECT a.id, a.business_id, a.customer_id, a.staff_id, a.appointment_date, 
-                        a.status, a.notes, a.admin_note, a.staff_note, a.customer_note, a.created_at, a.updated_at,
-                        c.full_name as customer_full_name, c.email as customer_email, c.phone as customer_phone,
-                        s.full_name as staff_full_name, s.email as staff_email, s.phone as staff_phone
-                        FROM appointments a
-                        LEFT JOIN customers c ON c.id = a.customer_id AND c.business_id = a.business_id
-                        LEFT JOIN staff s ON s.id = a.staff_id AND s.business_id = a.business_id
-                        WHERE a.business_id = %s AND a.id = %s LIMIT 1""",
-                        (business_id, appointment_id)
-                    )
-                    appointment = await cursor.fetchone()
-                    
-                    if not appointment:
-                        raise HTTPException(
-                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail="Failed to retrieve updated appointment"
-                        )
-                    
-                    # Fetch services
-                    await cursor.execute(
-                        """
-                        SELECT 
-                            aps.service_id,
-                            s.name,
-                            s.duration_minutes,
-                            aps.price,
-                            aps.created_at
-                        FROM appointments a
-                        LEFT JOIN appointment_services aps ON aps.appointment_id = a.id
-                        LEFT JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-                        WHERE a.business_id = %s AND a.id = %s
-                        ORDER BY aps.created_at
-                        """,
-                        (business_id, appointment_id)
-                    )
-                    services_data = await cursor.fetchall()
-                    
-                    appointment['services'] = [
-                        {
-                            'service_id': s['service_id'],
-                            'name': s['name'],
-                            'duration_minutes': s['duration_minutes'],
-                            'price': s['price'],
-                            'created_at': s['created_at']
-                        }
-                        for s in services_data if s['service_id'] is not None
-                    ]
-                    
-                    # Fetch transaction if exists
-                    await cursor.execute(
-                        """SELECT id, amount, payment_method, status, transaction_date
-                        FROM transactions WHERE appointment_id = %s AND business_id = %s LIMIT 1""",
-                        (appointment_id, business_id)
-                    )
-                    transaction = await cursor.fetchone()
-                    appointment['transaction'] = transaction
-                
-                return appointment
-                
-            except HTTPException:
-                await conn.rollback()
-                raise
-            except Exception as e:
-                await conn.rollback()
-                logger.exception("Error rejecting appointment")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to reject appointment: {str(e)}"
-                )
-    except RuntimeError:
+    appointments = await _transition_pending_appointments(
+        business_id, [appointment_id], 'scheduled', admin_note or None, "approve"
+    )
+    return appointments[0]
+
+@router.post("/{appointment_id}/reject", response_model=AppointmentResponse, response_class=ORJSONResponse, summary="Reject pending appointment", description="Reject a pending appointment request (change status to 'cancelled' with note)")
+async def reject_appointment(
+    appointment_id: int,
+    admin_note: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Reject a pending appointment request"""
+    business_id = current_user.get("business_id")
+    if business_id is None:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database pool is not initialized"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload"
         )
-
+    
+    appointments = await _transition_pending_appointments(
+        business_id, [appointment_id], 'rejected', admin_note or "Rejected", "reject"
+    )
+    return appointments[0]
@@ -1,49 +1,37 @@
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import ORJSONResponse
 from app.models.schemas import UserRegister, UserLogin, TokenResponse, UserResponse, PasswordResetRequest, PasswordResetResponse, NewPasswordRequest
-from app.auth import get_password_hash, create_access_token, verify_password
-from app.db import get_db
-from app.dependencies import get_current_user
+from app.auth import get_password_hash, get_password_hash_async, create_access_token, verify_password_async
+from app.config import settings
+from app.dependencies import get_current_user, get_db_pool
 import aiomysql
+import hmac
+import logging
+import secrets
 
-# Güvenli pymysql import
-try:
-    import pymysql.err
-    IntegrityError = pymysql.err.IntegrityError
-except ImportError:
-    IntegrityError = None
+# pymysql aiomysql'in zorunlu bağımlılığı (aiomysql de aynı exception'ları kullanır)
+from pymysql.err import IntegrityError
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# Login'de kullanıcı yoksa da bcrypt doğrulaması bu hash'e karşı yapılır: var olan / olmayan
+# email için yanıt süresi aynı kalır (timing ile user enumeration yok). Modül yüklenirken bir kez üretilir.
+_DUMMY_PASSWORD_HASH = get_password_hash(secrets.token_hex(16))
 
 @router.post("/register", response_model=TokenResponse, summary="Register a new business", description="Create a new business account and receive a JWT token")
-async def register(user_data: UserRegister):
-    db_pool = await get_db()
+async def register(user_data: UserRegister, db_pool = Depends(get_db_pool)):
+    # Hash bağlantı alınmadan önce: bcrypt süresince (yüzlerce ms) pool slot'u tutulmaz
+    password_hash = await get_password_hash_async(user_data.password)
     
     async with db_pool.acquire() as conn:
         try:
             await conn.begin()
             
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                # Email kontrolü (business email unique)
-                await cursor.execute(
-                    "SELECT id FROM businesses WHERE email = %s LIMIT 1",
-                    (user_data.email,)
-                )
-                if await cursor.fetchone():
-                    raise HTTPException(
-                        status_code=409,
-                        detail="Email already exists"
-                    )
-                
-                # User email kontrolü
-                await cursor.execute(
-                    "SELECT id FROM users WHERE email = %s LIMIT 1",
-                    (user_data.email,)
-                )
-                if await cursor.fetchone():
-                    raise HTTPException(
-                        status_code=409,
-                        detail="Email already exists"
-                    )
+            async with conn.cursor(aiomysql.Cursor) as cursor:
+                # Ayrı email kontrolü yok: businesses.email ve users.email UNIQUE, duplicate email
+                # INSERT'te IntegrityError (1062) ile 409'a çevrilir (SELECT ile INSERT arası yarış da yok)
                 
                 # Business oluştur
                 await cursor.execute(
@@ -53,7 +41,6 @@ async def register(user_data: UserRegister):
                 business_id = cursor.lastrowid
                 
                 # User oluştur
-                password_hash = get_password_hash(user_data.password)
                 await cursor.execute(
                     "INSERT INTO users (business_id, email, password_hash, full_name, role) VALUES (%s, %s, %s, %s, 'owner')",
                     (business_id, user_data.email, password_hash, user_data.full_name)
@@ -74,63 +61,66 @@ async def register(user_data: UserRegister):
                     "business_id": business_id
                 })
                 return {"access_token": access_token, "token_type": "bearer"}
-        except HTTPException:
+        except IntegrityError as e:
             await conn.rollback()
-            raise
-        except Exception as e:
-            await conn.rollback()
-            if IntegrityError and isinstance(e, IntegrityError):
+            # Sadece duplicate key (1062): email businesses veya users tablosunda zaten var (UNIQUE index).
+            # Diğer constraint hataları (FK / NOT NULL vb.) email çakışması değildir
+            if e.args and e.args[0] == 1062:
                 raise HTTPException(
                     status_code=409,
                     detail="Email already exists"
                 )
+            logger.exception("Registration integrity error")
+            raise HTTPException(
+                status_code=500,
+                detail="Registration failed"
+            )
+        except Exception as e:
+            await conn.rollback()
             raise HTTPException(
                 status_code=500,
                 detail="Registration failed"
             )
 
 @router.post("/login", response_model=TokenResponse, summary="Login", description="Authenticate and receive a JWT token")
-async def login(login_data: UserLogin):
-    db_pool = await get_db()
-    
-    if db_pool is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Database pool is not initialized"
-        )
-    
+async def login(login_data: UserLogin, db_pool = Depends(get_db_pool)):
+    # try sadece DB okumasını sarar; 401 dışarıda fırlatılır (except HTTPException: raise gerekmez)
+    # bcrypt doğrulaması connection pool'a döndükten sonra
     try:
         async with db_pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
+            # Tuple cursor: sadece kullanılan 3 kolon, satır başına dict kurulmaz
+            # (pool'un default cursorclass'ı DictCursor olduğu için aiomysql.Cursor açıkça verilir)
+            async with conn.cursor(aiomysql.Cursor) as cursor:
                 await cursor.execute(
-                    "SELECT id, business_id, email, password_hash, full_name, role FROM users WHERE email = %s LIMIT 1",
+                    "SELECT id, business_id, password_hash FROM users WHERE email = %s LIMIT 1",
                     (login_data.email,)
                 )
                 user = await cursor.fetchone()
-                
-                if not user or not verify_password(login_data.password, user["password_hash"]):
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Invalid credentials"
-                    )
-                
-                # JWT token oluştur (sub ve business_id ile)
-                access_token = create_access_token(data={
-                    "sub": str(user["id"]),
-                    "business_id": user["business_id"]
-                })
-                return {"access_token": access_token, "token_type": "bearer"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        # Log the error for debugging
-        import traceback
-        print(f"Login error: {str(e)}")
-        print(traceback.format_exc())
+    except Exception:
+        logger.exception("Login error")
         raise HTTPException(
             status_code=500,
             detail="Login failed"
         )
+    
+    password_hash = user[2] if user else _DUMMY_PASSWORD_HASH
+    password_ok = await verify_password_async(login_data.password, password_hash)
+    if not user or not password_ok:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid credentials"
+        )
+    
+    user_id, business_id, _ = user
+    
+    # JWT token oluştur (sub ve business_id ile)
+    access_token = create_access_token(data={
+        "sub": str(user_id),
+        "business_id": business_id
+    })
+    # Response doğrudan döner: iki sabit alanlı dict için TokenResponse validation +
+    # jsonable_encoder atlanır (response_model OpenAPI şeması için kalır)
+    return ORJSONResponse({"access_token": access_token, "token_type": "bearer"})
 
 @router.get("/me", response_model=UserResponse, summary="Get current user", description="Get the current authenticated user's information")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
@@ -139,49 +129,19 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
 
 @router.post("/reset-password", response_model=PasswordResetResponse, summary="Request password reset", description="Request a password reset for the given email")
 async def reset_password(request: PasswordResetRequest):
-    """Request password reset - validates email exists"""
-    db_pool = await get_db()
-    
-    if db_pool is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Database pool is not initialized"
-        )
-    
-    try:
-        async with db_pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                # Check if user exists
-                await cursor.execute(
-                    "SELECT id, email FROM users WHERE email = %s LIMIT 1",
-                    (request.email,)
-                )
-                user = await cursor.fetchone()
-                
-                # Always return success message (security best practice - don't reveal if email exists)
-                # In production, you would send an email with a reset link/token here
-                return {"message": "If the email exists, you will receive a password reset link."}
-                
-    except Exception as e:
-        # Log error but still return generic message
-        import traceback
-        print(f"Password reset request error: {str(e)}")
-        print(traceback.format_exc())
-        return {"message": "If the email exists, you will receive a password reset link."}
+    """Request password reset"""
+    # Always return success message (security best practice - don't reveal if email exists)
+    # Email gönderimi henüz yok: kullanıcı araması sonucu kullanılmadığı için DB'ye gidilmez.
+    # Gönderim eklendiğinde lookup + gönderim BackgroundTasks ile response sonrasına alınmalı
+    # (yanıt süresi email'in var olup olmamasından bağımsız kalır)
+    return {"message": "If the email exists, you will receive a password reset link."}
 
 @router.post("/new-password", response_model=PasswordResetResponse, summary="Set new password", description="Set a new password with verification code")
-async def set_new_password(request: NewPasswordRequest):
+async def set_new_password(request: NewPasswordRequest, db_pool = Depends(get_db_pool)):
     """Set new password after verification code check"""
-    db_pool = await get_db()
-    
-    if db_pool is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Database pool is not initialized"
-        )
-    
-    # Validate code (must be "123456" for now)
-    if request.code != "123456":
+    # Validate code (settings.PASSWORD_RESET_CODE, default "123456" for now)
+    # Sabit süreli karşılaştırma: ilk farklı byte'ta dönmez, kod timing ile tahmin edilemez
+    if not hmac.compare_digest(request.code.encode(), settings.PASSWORD_RESET_CODE.encode()):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid verification code"
@@ -201,39 +161,37 @@ async def set_new_password(request: NewPasswordRequest):
             detail="Password must be at least 8 characters long"
         )
     
+    # Hash bağlantı alınmadan önce (bcrypt süresince pool slot'u tutulmaz)
+    password_hash = await get_password_hash_async(request.password)
+    
+    # try sadece DB işlemlerini sarar; 404 dışarıda fırlatılır (except HTTPException: raise gerekmez)
     try:
         async with db_pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                # Check if user exists
-                await cursor.execute(
-                    "SELECT id, email FROM users WHERE email = %s LIMIT 1",
-                    (request.email,)
-                )
-                user = await cursor.fetchone()
-                
-                if not user:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="User not found"
-                    )
-                
-                # Update password
-                password_hash = get_password_hash(request.password)
+            async with conn.cursor(aiomysql.Cursor) as cursor:
+                # Tek UPDATE: ayrı varlık SELECT'i yok. Yeni hash (yeni salt) her zaman satırı değiştirir,
+                # rowcount == 0 ise kullanıcı yok
                 await cursor.execute(
-                    "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE id = %s",
-                    (password_hash, user["id"])
+                    "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE email = %s",
+                    (password_hash, request.email)
                 )
-                await conn.commit()
+                updated = cursor.rowcount > 0
                 
-                return {"message": "Password has been reset successfully!"}
-                
-    except HTTPException:
-        raise
-    except Exception as e:
-        import traceback
-        print(f"Password reset error: {str(e)}")
-        print(traceback.format_exc())
+                if updated:
+                    await conn.commit()
+                else:
+                    # Boş implicit transaction'ı kapat (connection pool'a temiz döner)
+                    await conn.rollback()
+    except Exception:
+        logger.exception("Password reset error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to reset password"
         )
+    
+    if not updated:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    return {"message": "Password has been reset successfully!"}
@@ -1,17 +1,77 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
 from app.dependencies import get_current_user, require_not_staff
 from app.db import get_connection
+from app.sql_utils import JSON_IDS_SQL, json_ids
 from app.models.schemas import BookingLinkCreate, BookingLinkUpdate, BookingLinkResponse
 from typing import List, Optional
 import aiomysql
 import logging
 import secrets
-import json
+import orjson
+from pymysql.err import IntegrityError
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _load_ids(link: dict, field: str) -> Optional[List[int]]:
+    """JSON id listesi kolonunu parse eder (NULL/boş veya bozuksa None)."""
+    value = link[field]
+    if not value:
+        return None
+    try:
+        return orjson.loads(value) if isinstance(value, (bytes, str)) else value
+    except orjson.JSONDecodeError as e:
+        logger.warning(f"Failed to parse {field} for booking link {link.get('id')}: {e}")
+        return None
+
+def _normalize_booking_link(link: dict) -> dict:
+    """service_ids / staff_ids JSON kolonlarını listeye çevirir. start_date/end_date date olarak
+    kalır, BookingLinkResponse (Optional[date]) ISO formatında serialize eder."""
+    link['service_ids'] = _load_ids(link, 'service_ids')
+    link['staff_ids'] = _load_ids(link, 'staff_ids')
+    return link
+
+# service_ids / staff_ids doğrulaması: SQL metni sabit (id listeleri JSON parametre olarak,
+# JSON_TABLE ile açılır), liste uzunluğuna göre farklı IN (%s,...) string'i üretilmez
+_VALIDATE_LINK_TARGETS_SQL = f"""
+    SELECT 's' AS kind, id FROM services
+    WHERE business_id = %s AND id IN ({JSON_IDS_SQL}) AND is_active = 1
+    UNION ALL
+    SELECT 't' AS kind, id FROM staff
+    WHERE business_id = %s AND id IN ({JSON_IDS_SQL}) AND is_active = 1
+"""
+
+# booking_links.token UNIQUE: çakışma (1062) olursa INSERT yeni token ile tekrarlanır
+_TOKEN_INSERT_ATTEMPTS = 5
+_ER_DUP_ENTRY = 1062
+
+async def _validate_link_targets(cursor, business_id: int, service_ids: Optional[List[int]], staff_ids: Optional[List[int]]) -> None:
+    """service_ids / staff_ids'in bu business'a ait ve aktif olduğunu tek UNION ALL sorgusuyla doğrular
+    (boş/None listeler atlanır). Hangi alan hatalıysa 400 detail'inde o alan belirtilir."""
+    if not service_ids and not staff_ids:
+        return
+    
+    # Boş liste '[]' olarak gider, JSON_TABLE o tarafta satır üretmez
+    await cursor.execute(
+        _VALIDATE_LINK_TARGETS_SQL,
+        (business_id, json_ids(service_ids or []), business_id, json_ids(staff_ids or []))
+    )
+    found = {'s': 0, 't': 0}
+    for row in await cursor.fetchall():
+        found[row['kind']] += 1
+    
+    if service_ids and found['s'] != len(service_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="One or more service_ids are invalid or inactive"
+        )
+    if staff_ids and found['t'] != len(staff_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="One or more staff_ids are invalid or inactive"
+        )
+
 def generate_token() -> str:
     """Generate a cryptographically secure random token for booking links"""
     return secrets.token_urlsafe(32)  # 32 bytes = 43 characters URL-safe
@@ -38,121 +98,68 @@ async def create_booking_link(
                 await conn.begin()
                 
                 async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    # Generate unique token
-                    token = generate_token()
-                    # Ensure uniqueness (retry if collision, though extremely unlikely)
-                    max_retries = 5
-                    for _ in range(max_retries):
-                        await cursor.execute(
-                            "SELECT id FROM booking_links WHERE token = %s LIMIT 1",
-                            (token,)
-                        )
-                        if not await cursor.fetchone():
-                            break
+                    # service_ids / staff_ids doğrulaması tek sorguda (None = tümü)
+                    await _validate_link_targets(
+                        cursor, business_id, booking_link_data.service_ids, booking_link_data.staff_ids
+                    )
+                    service_ids_json = json_ids(booking_link_data.service_ids) if booking_link_data.service_ids else None
+                    staff_ids_json = json_ids(booking_link_data.staff_ids) if booking_link_data.staff_ids else None
+                    
+                    # Insert booking link: token uniqueness için ön SELECT yok, UNIQUE index INSERT'te
+                    # atomik olarak kontrol eder. Duplicate key InnoDB'de sadece statement'ı geri alır,
+                    # transaction devam eder; yeni token ile tekrar denenir
+                    for _ in range(_TOKEN_INSERT_ATTEMPTS):
                         token = generate_token()
+                        try:
+                            await cursor.execute(
+                                """INSERT INTO booking_links 
+                                (business_id, token, name, description, service_ids, staff_ids, start_date, end_date, max_uses, is_active)
+                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                                (business_id, token, booking_link_data.name, booking_link_data.description, service_ids_json, staff_ids_json, 
+                                 booking_link_data.start_date, booking_link_data.end_date, booking_link_data.max_uses, 1 if booking_link_data.is_active else 0)
+                            )
+                            break
+                        except IntegrityError as e:
+                            if e.args[0] != _ER_DUP_ENTRY:
+                                raise
                     else:
                         raise HTTPException(
                             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to generate unique token"
                         )
                     
-                    # Validate service_ids if provided
-                    service_ids_json = None
-                    if booking_link_data.service_ids:
-                        if len(booking_link_data.service_ids) == 0:
-                            raise HTTPException(
-                                status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="service_ids cannot be empty array. Use null for all services."
-                            )
-                        # Verify all services belong to this business and are active
-                        placeholders = ','.join(['%s'] * len(booking_link_data.service_ids))
-                        await cursor.execute(
-                            f"SELECT id FROM services WHERE business_id = %s AND id IN ({placeholders}) AND is_active = 1",
-                            (business_id, *booking_link_data.service_ids)
-                        )
-                        found_services = await cursor.fetchall()
-                        if len(found_services) != len(booking_link_data.service_ids):
-                            raise HTTPException(
-                                status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="One or more service_ids are invalid or inactive"
-                            )
-                        service_ids_json = json.dumps(booking_link_data.service_ids)
-                    
-                    # Validate staff_ids if provided
-                    staff_ids_json = None
-                    if booking_link_data.staff_ids:
-                        if len(booking_link_data.staff_ids) == 0:
-                            raise HTTPException(
-                                status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="staff_ids cannot be empty array. Use null for all staff."
-                            )
-                        # Verify all staff belong to this business and are active
-                        placeholders = ','.join(['%s'] * len(booking_link_data.staff_ids))
-                        await cursor.execute(
-                            f"SELECT id FROM staff WHERE business_id = %s AND id IN ({placeholders}) AND is_active = 1",
-                            (business_id, *booking_link_data.staff_ids)
-                        )
-                        found_staff = await cursor.fetchall()
-                        if len(found_staff) != len(booking_link_data.staff_ids):
-                            raise HTTPException(
-                                status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="One or more staff_ids are invalid or inactive"
-                            )
-                        staff_ids_json = json.dumps(booking_link_data.staff_ids)
-                    
-                    # Insert booking link
-                    await cursor.execute(
-                        """INSERT INTO booking_links 
-                        (business_id, token, name, description, service_ids, staff_ids, start_date, end_date, max_uses, is_active)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                        (business_id, token, booking_link_data.name, booking_link_data.description, service_ids_json, staff_ids_json, 
-                         booking_link_data.start_date, booking_link_data.end_date, booking_link_data.max_uses, 1 if booking_link_data.is_active else 0)
-                    )
                     booking_link_id = cursor.lastrowid
-                
-                await conn.commit()
-                
-                # Fetch created booking link
-                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    
+                    # Response INSERT edilen değerlerden kurulur; sadece DB'nin ürettiği/normalize ettiği
+                    # kolonlar (default'lar, timestamp'ler, DATE'e çevrilen string tarihler) commit öncesi
+                    # aynı cursor'da okunur (tüm satırı geri okuma + JSON parse yok)
                     await cursor.execute(
-                        """SELECT id, business_id, token, name, description, service_ids, staff_ids, 
-                        start_date, end_date, max_uses, current_uses, is_active, created_at, updated_at
-                        FROM booking_links WHERE id = %s AND business_id = %s LIMIT 1""",
-                        (booking_link_id, business_id)
+                        """SELECT start_date, end_date, current_uses, created_at, updated_at
+                        FROM booking_links WHERE id = %s LIMIT 1""",
+                        (booking_link_id,)
                     )
-                    booking_link = await cursor.fetchone()
+                    db_values = await cursor.fetchone()
                     
-                    if not booking_link:
+                    if not db_values:
                         raise HTTPException(
                             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to retrieve created booking link"
                         )
-                    
-                    # Parse JSON fields
-                    if booking_link['service_ids']:
-                        booking_link['service_ids'] = json.loads(booking_link['service_ids'])
-                    else:
-                        booking_link['service_ids'] = None
-                    
-                    if booking_link['staff_ids']:
-                        booking_link['staff_ids'] = json.loads(booking_link['staff_ids'])
-                    else:
-                        booking_link['staff_ids'] = None
-                    
-                    # Convert date objects to ISO format strings
-                    if booking_link.get('start_date'):
-                        if not isinstance(booking_link['start_date'], str):
-                            booking_link['start_date'] = booking_link['start_date'].isoformat() if hasattr(booking_link['start_date'], 'isoformat') else str(booking_link['start_date'])
-                    else:
-                        booking_link['start_date'] = None
-                    
-                    if booking_link.get('end_date'):
-                        if not isinstance(booking_link['end_date'], str):
-                            booking_link['end_date'] = booking_link['end_date'].isoformat() if hasattr(booking_link['end_date'], 'isoformat') else str(booking_link['end_date'])
-                    else:
-                        booking_link['end_date'] = None
-                    
-                    return booking_link
+                
+                await conn.commit()
+                
+                return {
+                    "id": booking_link_id,
+                    "business_id": business_id,
+                    "token": token,
+                    "name": booking_link_data.name,
+                    "description": booking_link_data.description,
+                    "service_ids": booking_link_data.service_ids or None,
+                    "staff_ids": booking_link_data.staff_ids or None,
+                    "max_uses": booking_link_data.max_uses,
+                    "is_active": booking_link_data.is_active,
+                    **db_values,
+                }
                     
             except HTTPException:
                 await conn.rollback()
@@ -196,58 +203,8 @@ async def list_booking_links(
                 )
                 booking_links = await cursor.fetchall()
                 
-                # Parse JSON fields and convert date objects to strings
                 for link in booking_links:
-                    try:
-                        if link['service_ids']:
-                            if isinstance(link['service_ids'], str):
-                                link['service_ids'] = json.loads(link['service_ids'])
-                            elif isinstance(link['service_ids'], (list, dict)):
-                                # Already parsed
-                                pass
-                            else:
-                                link['service_ids'] = None
-                        else:
-                            link['service_ids'] = None
-                    except (json.JSONDecodeError, TypeError) as e:
-                        logger.warning(f"Failed to parse service_ids for booking link {link.get('id')}: {e}")
-                        link['service_ids'] = None
-                    
-                    try:
-                        if link['staff_ids']:
-                            if isinstance(link['staff_ids'], str):
-                                link['staff_ids'] = json.loads(link['staff_ids'])
-                            elif isinstance(link['staff_ids'], (list, dict)):
-                                # Already parsed
-                                pass
-                            else:
-                                link['staff_ids'] = None
-                        else:
-                            link['staff_ids'] = None
-                    except (json.JSONDecodeError, TypeError) as e:
-                        logger.warning(f"Failed to parse staff_ids for booking link {link.get('id')}: {e}")
-                        link['staff_ids'] = None
-                    
-                    # Convert date objects to ISO format strings
-                    if link.get('start_date'):
-                        if isinstance(link['start_date'], str):
-                            # Already a string
-                            pass
-                        else:
-                            # datetime.date or datetime.datetime object
-                            link['start_date'] = link['start_date'].isoformat() if hasattr(link['start_date'], 'isoformat') else str(link['start_date'])
-                    else:
-                        link['start_date'] = None
-                    
-                    if link.get('end_date'):
-                        if isinstance(link['end_date'], str):
-                            # Already a string
-                            pass
-                        else:
-                            # datetime.date or datetime.datetime object
-                            link['end_date'] = link['end_date'].isoformat() if hasattr(link['end_date'], 'isoformat') else str(link['end_date'])
-                    else:
-                        link['end_date'] = None
+                    _normalize_booking_link(link)
                 
                 return booking_links
     except HTTPException:
@@ -297,29 +254,7 @@ async def get_booking_link(
                         detail="Booking link not found"
                     )
                 
-                # Parse JSON fields
-                if booking_link['service_ids']:
-                    booking_link['service_ids'] = json.loads(booking_link['service_ids'])
-                else:
-                    booking_link['service_ids'] = None
-                
-                if booking_link['staff_ids']:
-                    booking_link['staff_ids'] = json.loads(booking_link['staff_ids'])
-                else:
-                    booking_link['staff_ids'] = None
-                
-                # Convert date objects to ISO format strings
-                if booking_link.get('start_date'):
-                    if not isinstance(booking_link['start_date'], str):
-                        booking_link['start_date'] = booking_link['start_date'].isoformat() if hasattr(booking_link['start_date'], 'isoformat') else str(booking_link['start_date'])
-                else:
-                    booking_link['start_date'] = None
-                
-                if booking_link.get('end_date'):
-                    if not isinstance(booking_link['end_date'], str):
-                        booking_link['end_date'] = booking_link['end_date'].isoformat() if hasattr(booking_link['end_date'], 'isoformat') else str(booking_link['end_date'])
-                else:
-                    booking_link['end_date'] = None
+                _normalize_booking_link(booking_link)
                 
                 return booking_link
     except HTTPException:
@@ -353,16 +288,11 @@ async def update_booking_link(
                 await conn.begin()
                 
                 async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    # Check if booking link exists
-                    await cursor.execute(
-                        "SELECT id FROM booking_links WHERE id = %s AND business_id = %s LIMIT 1",
-                        (booking_link_id, business_id)
+                    # Ayrı varlık SELECT'i yok: 404 kararı UPDATE sonrası okumadan
+                    # Boş olmayan service_ids / staff_ids tek sorguda doğrulanır (boş liste = NULL, doğrulama yok)
+                    await _validate_link_targets(
+                        cursor, business_id, booking_link_data.service_ids, booking_link_data.staff_ids
                     )
-                    if not await cursor.fetchone():
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Booking link not found"
-                        )
                     
                     # Build update query dynamically
                     update_fields = []
@@ -380,39 +310,15 @@ async def update_booking_link(
                         if len(booking_link_data.service_ids) == 0:
                             update_fields.append("service_ids = NULL")
                         else:
-                            # Validate services
-                            placeholders = ','.join(['%s'] * len(booking_link_data.service_ids))
-                            await cursor.execute(
-                                f"SELECT id FROM services WHERE business_id = %s AND id IN ({placeholders}) AND is_active = 1",
-                                (business_id, *booking_link_data.service_ids)
-                            )
-                            found_services = await cursor.fetchall()
-                            if len(found_services) != len(booking_link_data.service_ids):
-                                raise HTTPException(
-                                    status_code=status.HTTP_400_BAD_REQUEST,
-                                    detail="One or more service_ids are invalid or inactive"
-                                )
                             update_fields.append("service_ids = %s")
-                            update_values.append(json.dumps(booking_link_data.service_ids))
+                            update_values.append(json_ids(booking_link_data.service_ids))
                     
                     if booking_link_data.staff_ids is not None:
                         if len(booking_link_data.staff_ids) == 0:
                             update_fields.append("staff_ids = NULL")
                         else:
-                            # Validate staff
-                            placeholders = ','.join(['%s'] * len(booking_link_data.staff_ids))
-                            await cursor.execute(
-                                f"SELECT id FROM staff WHERE business_id = %s AND id IN ({placeholders}) AND is_active = 1",
-                                (business_id, *booking_link_data.staff_ids)
-                            )
-                            found_staff = await cursor.fetchall()
-                            if len(found_staff) != len(booking_link_data.staff_ids):
-                                raise HTTPException(
-                                    status_code=status.HTTP_400_BAD_REQUEST,
-                                    detail="One or more staff_ids are invalid or inactive"
-                                )
                             update_fields.append("staff_ids = %s")
-                            update_values.append(json.dumps(booking_link_data.staff_ids))
+                            update_values.append(json_ids(booking_link_data.staff_ids))
                     
                     if booking_link_data.start_date is not None:
                         update_fields.append("start_date = %s")
@@ -442,11 +348,10 @@ async def update_booking_link(
                     
                     update_query = f"UPDATE booking_links SET {', '.join(update_fields)} WHERE id = %s AND business_id = %s"
                     await cursor.execute(update_query, tuple(update_values))
-                
-                await conn.commit()
-                
-                # Fetch updated booking link
-                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    
+                    # Response aynı cursor ve transaction içinde, commit öncesi okunur (ikinci cursor yok).
+                    # MySQL rowcount değişen satır sayısıdır (aynı saniyede aynı değerler 0 döner),
+                    # bu yüzden 404 kararı bu SELECT'in sonucuna göre verilir
                     await cursor.execute(
                         """SELECT id, business_id, token, name, description, service_ids, staff_ids,
                         start_date, end_date, max_uses, current_uses, is_active, created_at, updated_at
@@ -455,32 +360,16 @@ async def update_booking_link(
                     )
                     booking_link = await cursor.fetchone()
                     
-                    if booking_link:
-                        # Parse JSON fields
-                        if booking_link['service_ids']:
-                            booking_link['service_ids'] = json.loads(booking_link['service_ids'])
-                        else:
-                            booking_link['service_ids'] = None
-                        
-                        if booking_link['staff_ids']:
-                            booking_link['staff_ids'] = json.loads(booking_link['staff_ids'])
-                        else:
-                            booking_link['staff_ids'] = None
-                        
-                        # Convert date objects to ISO format strings
-                        if booking_link.get('start_date'):
-                            if not isinstance(booking_link['start_date'], str):
-                                booking_link['start_date'] = booking_link['start_date'].isoformat() if hasattr(booking_link['start_date'], 'isoformat') else str(booking_link['start_date'])
-                        else:
-                            booking_link['start_date'] = None
-                        
-                        if booking_link.get('end_date'):
-                            if not isinstance(booking_link['end_date'], str):
-                                booking_link['end_date'] = booking_link['end_date'].isoformat() if hasattr(booking_link['end_date'], 'isoformat') else str(booking_link['end_date'])
-                        else:
-                            booking_link['end_date'] = None
+                    if not booking_link:
+                        raise HTTPException(
+                            status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Booking link not found"
+                        )
                     
-                    return booking_link
+                    _normalize_booking_link(booking_link)
+                
+                await conn.commit()
+                return booking_link
                     
             except HTTPException:
                 await conn.rollback()
@@ -520,22 +409,16 @@ async def delete_booking_link(
                 await conn.begin()
                 
                 async with conn.cursor(aiomysql.DictCursor) as cursor:
-                    # Check if booking link exists
+                    # Delete booking link; ayrı varlık SELECT'i yok, 404 rowcount'tan
                     await cursor.execute(
-                        "SELECT id FROM booking_links WHERE id = %s AND business_id = %s LIMIT 1",
+                        "DELETE FROM booking_links WHERE id = %s AND business_id = %s",
                         (booking_link_id, business_id)
                     )
-                    if not await cursor.fetchone():
+                    if cursor.rowcount == 0:
                         raise HTTPException(
                             status_code=status.HTTP_404_NOT_FOUND,
                             detail="Booking link not found"
                         )
-                    
-                    # Delete booking link
-                    await cursor.execute(
-                        "DELETE FROM booking_links WHERE id = %s AND business_id = %s",
-                        (booking_link_id, business_id)
-                    )
                 
                 await conn.commit()
                 return {"message": "Booking link deleted successfully"}
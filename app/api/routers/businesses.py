@@ -1,13 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.dependencies import get_current_user
-from app.db import get_db
+from app.db import get_db, end_read_transaction
 from app.models.schemas import BusinessResponse
+from app.cache import TTLCache
 import aiomysql
 
 router = APIRouter()
 
+# businesses satırı API üzerinden güncellenmiyor (sadece register'da INSERT), /me sonucu
+# process içinde kısa TTL ile cache'lenir (Redis yok, worker başına). DB'den elle yapılan
+# değişiklikler en geç TTL sonunda görünür
+_BUSINESS_CACHE_TTL_SECONDS = 300
+_business_cache = TTLCache(maxsize=1000)
+
 @router.get("/me", response_model=BusinessResponse, summary="Get current business", description="Get the authenticated business's information")
 async def get_my_business(current_user: dict = Depends(get_current_user)):
+    business_id = current_user["business_id"]
+    business = _business_cache.get(business_id)
+    if business is not None:
+        # Kopya döner: response tarafında yapılan değişiklik cache'teki satırı bozmaz
+        return dict(business)
+    
     try:
         db_pool = await get_db()
     except RuntimeError:
@@ -20,14 +33,16 @@ async def get_my_business(current_user: dict = Depends(get_current_user)):
         async with conn.cursor(aiomysql.DictCursor) as cursor:
             await cursor.execute(
                 "SELECT id, name, email, phone, address, created_at, updated_at FROM businesses WHERE id = %s LIMIT 1",
-                (current_user["business_id"],)
+                (business_id,)
             )
             business = await cursor.fetchone()
-            
-            if not business:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Business not found"
-                )
-            
-            return business
+        await end_read_transaction(conn)
+    
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    _business_cache.set(business_id, dict(business), _BUSINESS_CACHE_TTL_SECONDS)
+    return business
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from app.dependencies import get_current_user, require_not_staff
 from app.db import get_db
 from app.models.schemas import StaffCreate, StaffUpdate, StaffResponse
-from app.auth import get_password_hash
+from app.auth import get_password_hash_async
 from typing import List
 import aiomysql
 
@@ -86,7 +86,7 @@ async def create_staff(
                         )
                     
                     # Password hash oluştur
-                    password_hash = get_password_hash(staff_data.password)
+                    password_hash = await get_password_hash_async(staff_data.password)
                     
                     # User oluştur
                     await cursor.execute(
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from app.dependencies import get_current_user, require_owner
 from app.db import get_db
 from app.models.schemas import UserCreate, UserUpdate, UserListResponse, UserResponse
-from app.auth import get_password_hash
+from app.auth import get_password_hash_async
 from typing import List, Optional
 import aiomysql
 
@@ -142,7 +142,7 @@ async def create_user(
                     )
                 
                 # Password hash oluştur
-                password_hash = get_password_hash(user_data.password)
+                password_hash = await get_password_hash_async(user_data.password)
                 
                 # User oluştur
                 await cursor.execute(
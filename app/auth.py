@@ -1,24 +1,50 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+import bcrypt
+from app.cache import TTLCache
 from app.config import settings
 
-# bcrypt backend'i açıkça belirt
-pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__ident="2b", deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# bcrypt en fazla 72 byte kullanır; hash ve verify aynı şekilde byte seviyesinde kırpar
+# (passlib'in bcrypt backend'i de 72 byte'tan sonrasını yok sayıyordu, mevcut hash'ler uyumlu)
+_BCRYPT_MAX_BYTES = 72
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
-        # Password'ü 72 byte'a sınırla (bcrypt limiti)
-        if len(plain_password.encode('utf-8')) > 72:
-            plain_password = plain_password[:72]
-        return pwd_context.verify(plain_password, hashed_password)
+        return bcrypt.checkpw(
+            plain_password.encode('utf-8')[:_BCRYPT_MAX_BYTES],
+            hashed_password.encode('utf-8')
+        )
     except Exception as e:
         # Hata durumunda False dön
-        print(f"Password verification error: {e}")
+        logger.warning("Password verification error: %s", e)
         return False
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    # $2b$ ident (passlib bcrypt__ident="2b" ile aynı format)
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS, prefix=b"2b")
+    return bcrypt.hashpw(password.encode('utf-8')[:_BCRYPT_MAX_BYTES], salt).decode('ascii')
+
+# bcrypt bilerek yavaştır (yüzlerce ms); async handler'larda event loop'u bloklamamak için
+# thread pool'da çalıştırılır (bcrypt C tarafında GIL'i bırakır, process pool / pickle gerekmez).
+# Ayrı, CPU sayısıyla sınırlı executor: login burst'ünde tüm çekirdekler kullanılır ama
+# default executor'daki diğer to_thread işleri bcrypt kuyruğunun arkasında beklemez
+_password_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="bcrypt")
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -27,13 +53,27 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
-    return encoded_jwt
+    return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+# Doğrulanmış token'lar exp'e kadar process içinde cache'lenir: aynı token ile gelen
+# ardışık isteklerde imza doğrulama + JSON parse tekrarlanmaz. Token değişmez olduğundan
+# sonuç exp'e kadar geçerlidir; key ham token değil, blake2b digest'i
+_token_cache = TTLCache(maxsize=10000)
 
 def decode_token(token: str):
+    cache_key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    payload = _token_cache.get(cache_key)
+    if payload is not None:
+        # Kopya döner: çağıran taraf dict'i değiştirse de cache'teki payload bozulmaz
+        return dict(payload)
+    
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        return payload
     except JWTError:
         return None
-
+    
+    # exp'siz token cache'lenmez (süresiz geçerlilik cache'e taşınmasın)
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _token_cache.set(cache_key, dict(payload), exp - time.time())
+    return payload
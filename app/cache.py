@@ -0,0 +1,33 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+import time
+
+
+class TTLCache:
+    """
+    Process içi (worker başına), boyutu sınırlı TTL cache. Her kayıt kendi süresiyle saklanır;
+    süresi dolan kayıt okunurken atılır, maxsize aşılınca en eski eklenen kayıt atılır.
+    Değerler olduğu gibi döner: mutable değerleri (dict) çağıran taraf kopyalamalıdır.
+    """
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at > time.monotonic():
+            return value
+        self._entries.pop(key, None)
+        return None
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
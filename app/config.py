@@ -13,12 +13,31 @@ class Settings:
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
     DB_NAME: str = os.getenv("DB_NAME", "appointment_booking")
     
+    # Read replica (opsiyonel): boşsa read-only sorgular primary pool'u kullanır
+    DB_READ_HOST: str = os.getenv("DB_READ_HOST", "")
+    DB_READ_PORT: int = int(os.getenv("DB_READ_PORT", os.getenv("DB_PORT", 3306)))
+    
+    # Connection pool (worker başına): toplam bağlantı = worker sayısı x DB_POOL_MAXSIZE,
+    # MySQL max_connections (default 151) altında kalmalı
+    DB_POOL_MINSIZE: int = int(os.getenv("DB_POOL_MINSIZE", 5))
+    DB_POOL_MAXSIZE: int = int(os.getenv("DB_POOL_MAXSIZE", 25))
+    # wait_timeout'tan (default 8 saat) önce boşta kalan bağlantıları yenile
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 3600))
+    
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "secret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", 30))
     
+    # bcrypt cost factor (passlib default'u ile aynı: 12); hash ~250ms+ sürecek şekilde ayarlanmalı
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    
+    # Şifre sıfırlama doğrulama kodu (email akışı gelene kadar sabit kod)
+    PASSWORD_RESET_CODE: str = os.getenv("PASSWORD_RESET_CODE", "123456")
+    
     APP_ENV: str = os.getenv("APP_ENV", "development")
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
+    # "app" logger seviyesi (DEBUG'dan bağımsız; DEBUG seviyesi SQL/param dökümlerini açar)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
 
 settings = Settings()
 
@@ -6,20 +6,28 @@ from contextlib import asynccontextmanager
 logger = logging.getLogger(__name__)
 
 pool = None
+# Read replica pool'u (DB_READ_HOST tanımlı değilse None; read-only sorgular primary'e düşer)
+read_pool = None
 
 async def init_db():
-    global pool
+    global pool, read_pool
     # Idempotent: pool zaten varsa tekrar oluşturma
     if pool is not None:
         return
-    pool = await aiomysql.create_pool(
-        host=settings.DB_HOST,
-        port=settings.DB_PORT,
+    pool = await _create_pool(settings.DB_HOST, settings.DB_PORT)
+    if settings.DB_READ_HOST:
+        read_pool = await _create_pool(settings.DB_READ_HOST, settings.DB_READ_PORT)
+
+async def _create_pool(host: str, port: int):
+    return await aiomysql.create_pool(
+        host=host,
+        port=port,
         user=settings.DB_USER,
         password=settings.DB_PASSWORD,
         db=settings.DB_NAME,
-        minsize=1,
-        maxsize=10,
+        minsize=settings.DB_POOL_MINSIZE,
+        maxsize=settings.DB_POOL_MAXSIZE,
+        pool_recycle=settings.DB_POOL_RECYCLE,
         autocommit=False,  # Transaction control manuel (begin/commit/rollback)
         charset="utf8mb4",
         cursorclass=aiomysql.DictCursor,
@@ -29,7 +37,11 @@ async def init_db():
     )
 
 async def close_db():
-    global pool
+    global pool, read_pool
+    if read_pool is not None:
+        read_pool.close()
+        await read_pool.wait_closed()
+        read_pool = None
     # Pool yoksa sessizce dön
     if pool is None:
         return
@@ -114,10 +126,45 @@ async def get_connection():
         # Şimdilik RuntimeError olarak bırakıyoruz, endpoint'lerde yakalanacak
         raise
     
+    async with _pooled_connection(db_pool) as conn:
+        yield conn
+
+@asynccontextmanager
+async def get_readonly_connection():
+    """
+    Read-only sorgular için connection (list/activities gibi).
+    DB_READ_HOST tanımlıysa replica pool'dan, değilse primary pool'dan alır.
+    Yazma ve commit sonrası hemen okunması gereken satırlar (replica lag) için
+    get_connection() kullanılmalı.
+    """
+    db_pool = read_pool if read_pool is not None else await get_db()
+    async with _pooled_connection(db_pool) as conn:
+        yield conn
+
+async def end_read_transaction(conn):
+    """
+    Pool autocommit=False: salt okuma yapan bir handler'ın SELECT'i de implicit bir
+    transaction başlatır. aiomysql transaction'ı açık connection'ı release'te pool'a
+    koymaz, kapatır (sonraki acquire yeni TCP + auth handshake demek). Transaction
+    açıksa (server status flag'i, round-trip'siz kontrol) rollback ile kapatılır.
+    Commit/rollback etmiş handler'larda hiçbir şey yapmaz.
+    """
+    if conn.closed or not conn.get_transaction_status():
+        return
+    try:
+        await conn.rollback()
+    except Exception as e:
+        # Bozuk connection: release pool'dan düşürür
+        logger.warning(f"Rollback before release failed: {str(e)}")
+        conn.close()
+
+@asynccontextmanager
+async def _pooled_connection(db_pool):
     conn = await acquire_conn(db_pool)
     try:
         yield conn
     finally:
+        await end_read_transaction(conn)
         # Connection'ı pool'a geri ver
         try:
             db_pool.release(conn)
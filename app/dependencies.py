@@ -2,12 +2,32 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import RedirectResponse
 from app.auth import decode_token
-from app.db import get_db
+from app.db import get_db, end_read_transaction
 import aiomysql
 from typing import Optional, Literal
 
 security = HTTPBearer(auto_error=False)
 
+# User + (staff rolü için) bağlı staff_id tek sorguda
+# Korelasyonlu subquery: staff.user_id UNIQUE değil, LIMIT 1 ile eski davranış korunur
+_CURRENT_USER_SQL = """
+    SELECT u.id, u.business_id, u.email, u.full_name, u.role, u.created_at, u.updated_at,
+           (SELECT st.id FROM staff st WHERE st.user_id = u.id AND st.business_id = u.business_id LIMIT 1) AS staff_id
+    FROM users u
+    WHERE u.id = %s AND u.business_id = %s
+    LIMIT 1
+"""
+
+async def get_db_pool():
+    """DB pool dependency; pool init edilmemişse 503."""
+    try:
+        return await get_db()
+    except RuntimeError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database pool is not initialized"
+        )
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
@@ -64,35 +84,25 @@ async def get_current_user(
         )
     
     # DB'den user bilgisini çek (password_hash hariç, business_id ile birlikte kontrol)
+    # staff_id aynı sorguda çözülür (staff rolü için ayrı round-trip yok)
     async with db_pool.acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute(
-                "SELECT id, business_id, email, full_name, role, created_at, updated_at FROM users WHERE id = %s AND business_id = %s LIMIT 1",
-                (user_id, token_business_id)
-            )
+            await cursor.execute(_CURRENT_USER_SQL, (user_id, token_business_id))
             user = await cursor.fetchone()
-            if user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="User not found or unauthorized"
-                )
-            
-            # Staff rolü için staff_id bilgisini ekle
-            if user["role"] == "staff":
-                await cursor.execute(
-                    "SELECT id FROM staff WHERE user_id = %s AND business_id = %s LIMIT 1",
-                    (user_id, token_business_id)
-                )
-                staff = await cursor.fetchone()
-                if staff:
-                    user["staff_id"] = staff["id"]
-                else:
-                    # Staff rolünde ama staff kaydı yok - bu durumda staff_id None
-                    user["staff_id"] = None
-            else:
-                user["staff_id"] = None
-            
-            return user
+        # Salt okuma: implicit transaction kapatılır, connection pool'a geri döner (kapatılmaz)
+        await end_read_transaction(conn)
+    
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found or unauthorized"
+        )
+    
+    # Staff rolünde değilse staff_id None (staff kaydı yoksa subquery zaten NULL döner)
+    if user["role"] != "staff":
+        user["staff_id"] = None
+    
+    return user
 
 # Authorization helper functions
 def require_role(
@@ -187,29 +197,17 @@ async def get_current_user_for_html(request: Request):
     
     async with db_pool.acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute(
-                "SELECT id, business_id, email, full_name, role, created_at, updated_at FROM users WHERE id = %s AND business_id = %s LIMIT 1",
-                (user_id, token_business_id)
-            )
+            await cursor.execute(_CURRENT_USER_SQL, (user_id, token_business_id))
             user = await cursor.fetchone()
-            if user is None:
-                return None
-            
-            # Staff rolü için staff_id bilgisini ekle
-            if user["role"] == "staff":
-                await cursor.execute(
-                    "SELECT id FROM staff WHERE user_id = %s AND business_id = %s LIMIT 1",
-                    (user_id, token_business_id)
-                )
-                staff = await cursor.fetchone()
-                if staff:
-                    user["staff_id"] = staff["id"]
-                else:
-                    user["staff_id"] = None
-            else:
-                user["staff_id"] = None
-            
-            return user
+        await end_read_transaction(conn)
+    
+    if user is None:
+        return None
+    
+    if user["role"] != "staff":
+        user["staff_id"] = None
+    
+    return user
 
 async def require_auth_for_html(request: Request, allowed_roles: Optional[list[str]] = None):
     """Require authentication for HTML routes - returns user or redirects"""
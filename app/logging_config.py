@@ -0,0 +1,43 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from app.config import settings
+
+# Request path'inde QueueHandler.prepare() mesajı (ve varsa traceback'i) çağıran thread'de
+# formatlayıp kaydı kuyruğa ekler; stderr'e yazma (senkron I/O) QueueListener'ın arka plan
+# thread'inde yapılır (event loop stream yazımıyla bloklanmaz)
+_listener = None
+_queue_handler = None
+
+def start_logging():
+    global _listener, _queue_handler
+    # Idempotent: listener zaten çalışıyorsa tekrar kurma
+    if _listener is not None:
+        return
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    
+    app_logger = logging.getLogger("app")
+    _queue_handler = QueueHandler(log_queue)
+    app_logger.addHandler(_queue_handler)
+    app_logger.setLevel(settings.LOG_LEVEL)
+    # uvicorn root handler'ları ile çift log olmasın
+    app_logger.propagate = False
+
+def stop_logging():
+    global _listener, _queue_handler
+    # Listener yoksa sessizce dön
+    if _listener is None:
+        return
+    # Önce handler çıkarılır: stop sonrası kayıtlar sahipsiz kuyrukta birikmez,
+    # tekrar start_logging ikinci bir handler eklemez
+    logging.getLogger("app").removeHandler(_queue_handler)
+    _queue_handler = None
+    # Kuyrukta kalan kayıtları yazıp thread'i durdurur
+    _listener.stop()
+    _listener = None
@@ -1,9 +1,10 @@
 from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from app.db import init_db, close_db
+from app.logging_config import start_logging, stop_logging
 from app.api.routers import auth, businesses, customers, services, staff, appointments, transactions, settings, dashboard, booking_links, public_booking, users
 from app.dependencies import get_current_user_for_html, require_owner_or_admin, require_owner, require_not_staff
 
@@ -27,7 +28,9 @@ app = FastAPI(
     ## Multi-tenancy
     All data is automatically filtered by the authenticated user's business_id.
     """,
-    version="1.0.0"
+    version="1.0.0",
+    # Tüm API response'ları orjson ile (stdlib json yerine); HTML route'ları response_class'ı açıkça belirtir
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -46,11 +49,13 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 @app.on_event("startup")
 async def startup():
+    start_logging()
     await init_db()
 
 @app.on_event("shutdown")
 async def shutdown():
     await close_db()
+    stop_logging()
 
 @app.get("/health")
 async def health_check():
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr, ConfigDict, model_serializer
 from typing import Optional, List, Literal, Any
 from decimal import Decimal
-from datetime import datetime, time
+from datetime import date, datetime, time
 
 # Base Response Model (Decimal JSON encoder ile - recursive)
 class BaseResponseModel(BaseModel):
@@ -202,6 +202,11 @@ class AppointmentUpdate(BaseModel):
 class AppointmentStatusUpdate(BaseModel):
     status: Literal['pending', 'scheduled', 'completed', 'cancelled', 'rejected', 'no_show']
 
+# Bulk approve/reject (tek transaction, tek UPDATE)
+class AppointmentBulkAction(BaseModel):
+    appointment_ids: conlist(int, min_length=1, max_length=100)
+    admin_note: Optional[str] = None
+
 # Appointment Service Nested (for appointment list with services)
 # AppointmentResponse'dan önce tanımlanmalı (forward reference için)
 class AppointmentServiceNestedResponse(BaseResponseModel):
@@ -279,8 +284,8 @@ class BookingLinkResponse(BaseResponseModel):
     description: Optional[str]
     service_ids: Optional[List[int]]
     staff_ids: Optional[List[int]]
-    start_date: Optional[str]
-    end_date: Optional[str]
+    start_date: Optional[date]  # DATE kolonu; ISO (YYYY-MM-DD) olarak serialize edilir
+    end_date: Optional[date]
     max_uses: Optional[int]
     current_uses: int
     is_active: bool
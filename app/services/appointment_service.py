@@ -1,6 +1,26 @@
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from typing import List, Tuple, Optional
+import asyncio
+import weakref
 import aiomysql
+from app.sql_utils import JSON_IDS_SQL, json_ids
+
+# Process içi (business_id, staff_id, gün) booking lock'ları
+# Aynı staff-gün için eşzamanlı create istekleri DB'ye gitmeden burada sıraya girer;
+# bekleyen istek pool connection'ı ve InnoDB lock beklemesi tutmaz.
+# Nihai otorite yine DB'dir (staff_day_locks + check_double_booking); bu sadece ön elemedir.
+_booking_locks: "weakref.WeakValueDictionary[tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# check_double_booking service doğrulaması + toplam süre + buffer ayarı (sabit SQL metni)
+_SERVICES_DURATION_SQL = f"""
+    SELECT 
+        COUNT(DISTINCT id) as found_count,
+        COALESCE(SUM(duration_minutes), 0) as total_duration,
+        (SELECT buffer_time_minutes FROM business_settings WHERE business_id = %s LIMIT 1) as buffer_time_minutes
+    FROM services
+    WHERE id IN ({JSON_IDS_SQL}) AND business_id = %s AND is_active = TRUE
+"""
 
 
 def _normalize_datetime_to_utc_aware(dt: datetime) -> datetime:
@@ -23,6 +43,23 @@ def _normalize_datetime_to_utc_aware(dt: datetime) -> datetime:
         return dt.astimezone(timezone.utc)
 
 
+@asynccontextmanager
+async def staff_day_booking_lock(business_id: int, staff_id: int, appointment_date: datetime):
+    """
+    Aynı (business, staff, gün) için create isteklerini process içinde serileştirir.
+    
+    Lock objeleri WeakValueDictionary'de tutulur; bekleyen/tutan istek kalmayınca otomatik silinir.
+    Çok worker'lı kurulumda her worker kendi lock'unu tutar, DB lock'ları yine geçerlidir.
+    """
+    key = (business_id, staff_id, _normalize_datetime_to_utc_aware(appointment_date).date())
+    lock = _booking_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _booking_locks[key] = lock
+    async with lock:
+        yield
+
+
 async def check_double_booking(
     business_id: int,
     staff_id: int,
@@ -60,29 +97,12 @@ async def check_double_booking(
            - Lock alma sırası deterministik (day_date ascending) ki deadlock riski azalır
         2. appointments tablosunda SELECT ... FOR UPDATE (indeks-dostu range sorgusu, JOIN/GROUP BY olmadan)
            - Effective window aralığında çalışır (midnight/day-boundary edge-case'leri kapsar)
+           - Kilitlenen randevuların süreleri aynı sorguda subquery ile gelir
         
         DB seviyesindeki UNIQUE KEY (unique_business_staff_datetime) yalnızca "aynı start time"ı
         engeller; overlap (buffer time dahil) çakışmaları için tek başına yeterli değildir.
         Bu fonksiyon buffer time dahil overlap kontrolü sağlar ve midnight çakışmalarını yakalar.
     """
-    # Business settings (buffer_time_minutes) - NULL güvenli
-    await cursor.execute(
-        "SELECT buffer_time_minutes FROM business_settings WHERE business_id = %s LIMIT 1",
-        (business_id,)
-    )
-    settings = await cursor.fetchone()
-    # NULL güvenliği: settings varsa ama buffer_time_minutes NULL ise default kullan
-    # Tip güvenliği: Decimal/str gelebilir, int'e normalize et
-    buffer_minutes_raw = (
-        settings["buffer_time_minutes"] 
-        if settings and settings.get("buffer_time_minutes") is not None 
-        else 15
-    )
-    try:
-        buffer_minutes = int(buffer_minutes_raw)
-    except (TypeError, ValueError):
-        buffer_minutes = 15  # Fallback
-    
     # Service IDs doğrulaması (duplicate'leri normalize et)
     if not service_ids:
         raise ValueError("service_ids cannot be empty")
@@ -91,23 +111,31 @@ async def check_double_booking(
     unique_service_ids = list(dict.fromkeys(service_ids))
     expected_distinct_count = len(unique_service_ids)
     
-    # Tek sorguda doğrulama + toplam süre hesaplama (tenant-safe)
-    placeholders = ','.join(['%s'] * len(unique_service_ids))
+    # Tek sorguda doğrulama + toplam süre + buffer_time_minutes (tenant-safe, tek round-trip)
+    # business_settings scalar subquery: ayar satırı yoksa NULL döner
+    # id listesi JSON_TABLE ile: SQL metni service sayısından bağımsız sabit
     await cursor.execute(
-        f"""
-        SELECT 
-            COUNT(DISTINCT id) as found_count,
-            COALESCE(SUM(duration_minutes), 0) as total_duration
-        FROM services
-        WHERE id IN ({placeholders}) AND business_id = %s AND is_active = TRUE
-        """,
-        (*unique_service_ids, business_id)
+        _SERVICES_DURATION_SQL,
+        (business_id, json_ids(unique_service_ids), business_id)
     )
     service_result = await cursor.fetchone()
     
     if not service_result:
         raise ValueError("Failed to query services")
     
+    # Business settings (buffer_time_minutes) - NULL güvenli
+    # NULL güvenliği: settings yoksa veya buffer_time_minutes NULL ise default kullan
+    # Tip güvenliği: Decimal/str gelebilir, int'e normalize et
+    buffer_minutes_raw = (
+        service_result["buffer_time_minutes"]
+        if service_result["buffer_time_minutes"] is not None
+        else 15
+    )
+    try:
+        buffer_minutes = int(buffer_minutes_raw)
+    except (TypeError, ValueError):
+        buffer_minutes = 15  # Fallback
+    
     found_count = service_result["found_count"]
     new_duration_raw = service_result["total_duration"]
     
@@ -153,95 +181,78 @@ async def check_double_booking(
     # A) Deterministic lock: Boş gün race condition önleme
     # Effective window'un kapsadığı her gün için staff_day_locks satırını "touch" et
     # Lock alma sırası deterministik olsun (day_date ascending) ki deadlock riski azalır
-    for day_date in sorted(day_dates):  # Deterministic sıralama
-        await cursor.execute(
-            """
-            INSERT INTO staff_day_locks (business_id, staff_id, day_date)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE id = id
-            """,
-            (business_id, staff_id, day_date)
-        )
+    # Not: SKIP LOCKED kullanılmaz - atlanan satır çakışmanın görülmemesi demektir;
+    # bunun yerine (staff, gün) başına tek lock satırı tek statement'ta kilitlenir.
+    day_dates = sorted(day_dates)  # Deterministic sıralama
+    await cursor.executemany(
+        """
+        INSERT INTO staff_day_locks (business_id, staff_id, day_date)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE id = id
+        """,
+        [(business_id, staff_id, day_date) for day_date in day_dates]
+    )
     
-    # Her gün için SELECT ... FOR UPDATE ile lock al (deterministic sıralama)
-    for day_date in sorted(day_dates):  # Deterministic sıralama (deadlock önleme)
-        await cursor.execute(
-            """
-            SELECT id FROM staff_day_locks
-            WHERE business_id = %s AND staff_id = %s AND day_date = %s
-            FOR UPDATE
-            """,
-            (business_id, staff_id, day_date)
-        )
-        await cursor.fetchone()  # Lock'ı al, sonucu kullanmıyoruz
+    # Tüm günlerin lock satırlarını tek SELECT ... FOR UPDATE ile al
+    # UNIQUE (business_id, staff_id, day_date) üzerinde eşitlik araması: sadece record lock
+    # (range sorgusu gap lock alırdı), satırlar index sırasıyla (day_date ascending) kilitlenir
+    day_placeholders = ','.join(['%s'] * len(day_dates))
+    await cursor.execute(
+        f"""
+        SELECT id FROM staff_day_locks
+        WHERE business_id = %s AND staff_id = %s AND day_date IN ({day_placeholders})
+        ORDER BY day_date
+        FOR UPDATE
+        """,
+        (business_id, staff_id, *day_dates)
+    )
+    await cursor.fetchall()  # Lock'ları al, sonucu kullanmıyoruz
     
     # B) Base table appointments üzerinde indeks-dostu range sorgusu ile lock
     # Effective window aralığında çalış (midnight çakışmaları kaçmasın)
-    # JOIN/GROUP BY olmadan, sadece appointments tablosunda lock al
-    # Bu sorgu sadece appointment id + appointment_date döner
+    # Overlap için gereken duration aynı sorguda correlated subquery ile hesaplanır
+    # (ayrı bir duration sorgusu/round-trip yok). FOR UPDATE sadece dış sorgunun
+    # satırlarını (appointments) kilitler; subquery okumaları kilitlemez.
     lock_query_params = [business_id, staff_id, window_start, window_end]
     lock_query = """
         SELECT 
-            id,
-            appointment_date
-        FROM appointments
-        WHERE business_id = %s 
-          AND staff_id = %s
-          AND appointment_date >= %s
-          AND appointment_date < %s
-          AND status != 'cancelled'
+            a.id,
+            a.appointment_date,
+            (
+                SELECT COALESCE(SUM(s.duration_minutes), 0)
+                FROM appointment_services aps
+                INNER JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
+                WHERE aps.appointment_id = a.id
+            ) AS total_duration
+        FROM appointments a
+        WHERE a.business_id = %s 
+          AND a.staff_id = %s
+          AND a.appointment_date >= %s
+          AND a.appointment_date < %s
+          AND a.status != 'cancelled'
     """
     
     if exclude_appointment_id is not None:
-        lock_query += " AND id != %s"
+        lock_query += " AND a.id != %s"
         lock_query_params.append(exclude_appointment_id)
     
-    lock_query += " ORDER BY appointment_date FOR UPDATE"
+    lock_query += " ORDER BY a.appointment_date FOR UPDATE"
     
     await cursor.execute(lock_query, tuple(lock_query_params))
     locked_appointments = await cursor.fetchall()
     
-    # C) Overlap hesaplaması için duration verisini lock aldıktan sonra çek
-    # Lock'lanmış appointment_id listesi üzerinden duration hesapla
-    if locked_appointments:
-        appointment_ids = [apt['id'] for apt in locked_appointments]
-        placeholders = ','.join(['%s'] * len(appointment_ids))
-        
-        await cursor.execute(
-            f"""
-            SELECT 
-                a.id,
-                COALESCE(SUM(s.duration_minutes), 0) as total_duration
-            FROM appointments a
-            INNER JOIN appointment_services aps ON aps.appointment_id = a.id
-            INNER JOIN services s ON s.id = aps.service_id AND s.business_id = a.business_id
-            WHERE a.business_id = %s AND a.id IN ({placeholders})
-            GROUP BY a.id
-            """,
-            (business_id, *appointment_ids)
-        )
-        duration_results = await cursor.fetchall()
-        
-        # Duration map oluştur
-        duration_map = {row['id']: row['total_duration'] for row in duration_results}
-        
-        # Lock'lanmış appointment'lara duration ekle
-        existing_appointments = []
-        for apt in locked_appointments:
-            apt_id = apt['id']
-            duration = duration_map.get(apt_id, 0)
-            # Tip güvenliği: int'e normalize et
-            try:
-                duration = int(duration)
-            except (TypeError, ValueError):
-                duration = 0
-            existing_appointments.append({
-                'id': apt_id,
-                'appointment_date': apt['appointment_date'],
-                'total_duration': duration
-            })
-    else:
-        existing_appointments = []
+    existing_appointments = []
+    for apt in locked_appointments:
+        # Tip güvenliği: SUM Decimal döner, int'e normalize et
+        try:
+            duration = int(apt['total_duration'])
+        except (TypeError, ValueError):
+            duration = 0
+        existing_appointments.append({
+            'id': apt['id'],
+            'appointment_date': apt['appointment_date'],
+            'total_duration': duration
+        })
     
     # Python'da overlap kontrolü (datetime normalizasyonu ile)
     conflicting = []
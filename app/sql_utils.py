@@ -0,0 +1,11 @@
+from typing import List
+import orjson
+
+# IN-list filtreleri için JSON_TABLE: liste uzunluğundan bağımsız sabit SQL metni, tek parametre.
+# Kullanım: f"... id IN ({JSON_IDS_SQL})" + parametre json_ids(ids)
+JSON_IDS_SQL = "SELECT v FROM JSON_TABLE(%s, '$[*]' COLUMNS (v INT PATH '$')) AS ids"
+
+
+def json_ids(ids: List[int]) -> str:
+    """ID listesini JSON_TABLE parametresi / JSON kolonu değeri olarak encode eder (str - binary değil)."""
+    return orjson.dumps(ids).decode()
@@ -90,6 +90,7 @@ CREATE TABLE IF NOT EXISTS appointments (
     appointment_date DATETIME NOT NULL,
     status ENUM('pending', 'scheduled', 'completed', 'cancelled', 'rejected', 'no_show') NOT NULL DEFAULT 'scheduled',
     notes TEXT,
+    idempotency_key VARCHAR(64) NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (business_id) REFERENCES businesses(id) ON DELETE CASCADE,
@@ -102,11 +103,17 @@ CREATE TABLE IF NOT EXISTS appointments (
     INDEX idx_status (status),
     INDEX idx_business_staff_date (business_id, staff_id, appointment_date),
     INDEX idx_business_status_date (business_id, status, appointment_date),
-    UNIQUE KEY unique_business_staff_datetime (business_id, staff_id, appointment_date)
+    INDEX idx_business_date (business_id, appointment_date),
+    UNIQUE KEY unique_business_staff_datetime (business_id, staff_id, appointment_date),
+    -- Idempotency kontrolü: Idempotency-Key header'ı ile tekrar edilen create istekleri
+    UNIQUE KEY unique_business_idempotency (business_id, idempotency_key)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Mevcut DB için ALTER TABLE komutu (eğer tablo zaten varsa):
 -- ALTER TABLE appointments ADD UNIQUE KEY unique_business_staff_datetime (business_id, staff_id, appointment_date);
+-- ALTER TABLE appointments ADD INDEX idx_business_date (business_id, appointment_date);
+-- ALTER TABLE appointments ADD COLUMN idempotency_key VARCHAR(64) NULL;
+-- ALTER TABLE appointments ADD UNIQUE KEY unique_business_idempotency (business_id, idempotency_key);
 
 -- Not: Buffer time kontrolü application seviyesinde yapılacak
 
@@ -120,9 +127,14 @@ CREATE TABLE IF NOT EXISTS appointment_services (
     FOREIGN KEY (appointment_id) REFERENCES appointments(id) ON DELETE CASCADE,
     FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE,
     INDEX idx_appointment_id (appointment_id),
-    INDEX idx_service_id (service_id)
+    INDEX idx_service_id (service_id),
+    -- Services JSON_ARRAYAGG subquery'si (appointment_id eşitliği + created_at sırası)
+    INDEX idx_appointment_created (appointment_id, created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Mevcut DB için ALTER TABLE komutları (eğer tablo zaten varsa):
+-- ALTER TABLE appointment_services ADD INDEX idx_appointment_created (appointment_id, created_at);
+
 -- 8. staff_day_locks tablosu - Boş gün race condition önleme için deterministic lock
 -- Not: Bu tablo operational cleanup gerektirir. 180 günden eski kayıtlar periyodik olarak
 -- silinebilir (örn. cron job ile: DELETE FROM staff_day_locks WHERE day_date < DATE_SUB(CURDATE(), INTERVAL 180 DAY))
@@ -161,6 +173,8 @@ CREATE TABLE IF NOT EXISTS transactions (
     INDEX idx_customer_id (customer_id),
     INDEX idx_status (status),
     INDEX idx_transaction_date (transaction_date),
+    -- Appointment response'undaki transaction LEFT JOIN'i (appointment_id + business_id)
+    INDEX idx_appointment_business (appointment_id, business_id),
     -- Duplicate önleme: appointment_id NOT NULL ise (business_id, appointment_id, payment_method, amount, status) unique
     UNIQUE KEY unique_business_appointment_payment (business_id, appointment_id, payment_method, amount, status),
     -- Idempotency kontrolü: appointment_id NULL olanlar için idempotency_key ile duplicate önleme
@@ -171,6 +185,7 @@ CREATE TABLE IF NOT EXISTS transactions (
 -- ALTER TABLE transactions ADD COLUMN idempotency_key VARCHAR(64) NULL;
 -- ALTER TABLE transactions ADD UNIQUE KEY unique_business_appointment_payment (business_id, appointment_id, payment_method, amount, status);
 -- ALTER TABLE transactions ADD UNIQUE KEY unique_business_idempotency (business_id, idempotency_key);
+-- ALTER TABLE transactions ADD INDEX idx_appointment_business (appointment_id, business_id);
 
 -- 9. business_settings tablosu - İşletme Ayarları
 CREATE TABLE IF NOT EXISTS business_settings (
@@ -205,9 +220,12 @@ CREATE TABLE IF NOT EXISTS booking_links (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (business_id) REFERENCES businesses(id) ON DELETE CASCADE,
     INDEX idx_business_id (business_id),
-    INDEX idx_token (token),
     INDEX idx_is_active (is_active),
     INDEX idx_business_active (business_id, is_active),
     INDEX idx_date_range (start_date, end_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- token kolonundaki UNIQUE zaten index; ayrı idx_token gereksiz (uniqueness INSERT'te DB tarafından sağlanır)
+-- Mevcut DB için ALTER TABLE komutu (eğer tablo zaten varsa):
+-- ALTER TABLE booking_links DROP INDEX idx_token;
+